@@ -4,6 +4,8 @@
 
 import argparse
 from lib import libFURanalysis
+from lib import libFURdatabase
+from lib import libFURshared
 import sys
 
 ## Command line options:
@@ -21,6 +23,9 @@ parser.add_argument("-P","--password", help="SQL server password", action="store
 parser.add_argument("-D","--database", help="SQL server database", action="store")
 parser.add_argument("-T","--table", help="Table name", action="store")
 parser.add_argument("-v","--verbose", help="Increased verbosity", action="store_true")
+parser.add_argument("--profile", help="SQLite connection profile (default, bulk or read)", action="store")
+parser.add_argument("--metrics", help="Metrics filename (the timing of each stage is appended as a JSON line)", type=argparse.FileType('a'))
+parser.add_argument("--tracemalloc", help="Record the peak Python memory allocated by each stage in the metrics file (slower)", action="store_true")
 # Export options:
 parser.add_argument("--ori", help="Orientation", action="store")
 parser.add_argument("--end", help="End", action="store")
@@ -84,6 +89,29 @@ if args.database:
 elif "database" in loadedarguments:
     database = loadedarguments.get("database").strip()
 
+profile = "default"
+if args.profile:
+    profile=args.profile.lower()
+elif "profile" in loadedarguments:
+    profile = loadedarguments.get("profile").strip().lower()
+if profile not in libFURdatabase.sqliteprofiles:
+    print("\nAccepted connection profile options are default, bulk or read.\n")
+    sys.exit()
+
+# Stage metrics (see libFURshared.measureStage)
+metricsfile = None
+if args.metrics:
+    metricsfile=args.metrics
+elif "metrics" in loadedarguments:
+    metricsfile = open(loadedarguments.get("metrics").strip(),'a')
+
+tracememory = 0
+if args.tracemalloc:
+    tracememory=1
+elif "tracemalloc" in loadedarguments:
+    tracememory = int(loadedarguments.get("tracemalloc"))
+libFURshared.setMetricsFile(metricsfile, tracememory)
+
 # Input and output files (NOTE: The command line interface reuses the input/output option so this should be passed at the prompt)
 inputfile = None
 if args.input:
@@ -193,7 +221,7 @@ if args.action.lower()=="export":
     if verbosity:
         print("Connecting to FUR database")
     try:
-        analysisobj = libFURanalysis.analysis(username,password,hostname,database,verbosity)
+        analysisobj = libFURanalysis.analysis(username,password,hostname,database,verbosity,profile)
     except:
         print("\nError connecting to database - check the settings used.\n")
         raise
@@ -223,7 +251,7 @@ elif args.action.lower()=="reportall":
     if verbosity:
         print("Connecting to FUR database")
     try:
-        analysisobj = libFURanalysis.analysis(username,password,hostname,database,verbosity)
+        analysisobj = libFURanalysis.analysis(username,password,hostname,database,verbosity,profile)
     except:
         raise("Error connecting to database - check the settings used.")
     # Set the table:
@@ -249,7 +277,7 @@ elif args.action.lower()=="reportgtf":
     if verbosity:
         print("Connecting to FUR database")
     try:
-        analysisobj = libFURanalysis.analysis(username,password,hostname,database,verbosity)
+        analysisobj = libFURanalysis.analysis(username,password,hostname,database,verbosity,profile)
     except:
         raise("Error connecting to database - check the settings used.")
     # Set the table:
@@ -275,7 +303,7 @@ elif args.action.lower()=="reportcount":
     if verbosity:
         print("Connecting to FUR database")
     try:
-        analysisobj = libFURanalysis.analysis(username,password,hostname,database,verbosity)
+        analysisobj = libFURanalysis.analysis(username,password,hostname,database,verbosity,profile)
     except:
         raise("Error connecting to database - check the settings used.")
     # Set the table:
@@ -301,7 +329,7 @@ elif args.action.lower()=="reportcontigcount":
     if verbosity:
         print("Connecting to FUR database")
     try:
-        analysisobj = libFURanalysis.analysis(username,password,hostname,database,verbosity)
+        analysisobj = libFURanalysis.analysis(username,password,hostname,database,verbosity,profile)
     except:
         raise("Error connecting to database - check the settings used.")
     # Set the table:
@@ -3,6 +3,7 @@
 # Testing file for FUR inspect Functions
 
 from lib import libFURinspect
+from lib import libFURdatabase
 import argparse
 import sys
 
@@ -18,6 +19,7 @@ parser.add_argument("-U","--username", help="SQL server username", action="store
 parser.add_argument("-P","--password", help="SQL server password", action="store")
 parser.add_argument("-D","--database", help="SQL server database", action="store")
 parser.add_argument("-v","--verbose", help="Increased verbosity", action="store_true")
+parser.add_argument("--profile", help="SQLite connection profile (default, bulk or read)", action="store")
 parser.add_argument("-T","--table", help="Table name", action="store")
 parser.add_argument("-i","--id", help="ID number", nargs=1, type=int)
 
@@ -71,6 +73,15 @@ if args.database:
 elif "database" in loadedarguments:
     database = loadedarguments.get("database").strip()
 
+profile = "default"
+if args.profile:
+    profile=args.profile.lower()
+elif "profile" in loadedarguments:
+    profile = loadedarguments.get("profile").strip().lower()
+if profile not in libFURdatabase.sqliteprofiles:
+    print("\nAccepted connection profile options are default, bulk or read.\n")
+    sys.exit()
+
 # Inspection specific options
 
 tablename = "DeduplicatedContigs"
@@ -96,7 +107,7 @@ if args.action.lower()=="lookupsequence":
     # Connect:
     if verbosity:
         print("Connecting to database\n")
-    inspectobj = libFURinspect.inspect(username,password,hostname,database,verbosity)
+    inspectobj = libFURinspect.inspect(username,password,hostname,database,verbosity,profile)
     # Get the sequence
     if verbosity:
         print("Retrieving sequence for contig "+str(idnum)+" from table "+str(tablename))
@@ -108,7 +119,7 @@ elif args.action.lower()=="lookupanno":
     # Connect:
     if verbosity:
         print("Connecting to database\n")
-    inspectobj = libFURinspect.inspect(username,password,hostname,database,verbosity)
+    inspectobj = libFURinspect.inspect(username,password,hostname,database,verbosity,profile)
     # Look up which contigs refer to an annotation
     contigs = inspectobj.annoContigs(idnum, tablename)
     if verbosity:
@@ -124,7 +135,7 @@ elif args.action.lower()=="lookupcontig":
     # Connect:
     if verbosity:
         print("Connecting to database\n")
-    inspectobj = libFURinspect.inspect(username,password,hostname,database,verbosity)
+    inspectobj = libFURinspect.inspect(username,password,hostname,database,verbosity,profile)
     # Look up which annotation a contig relates
     anno = inspectobj.contigAnno(idnum, tablename)
     if verbosity:
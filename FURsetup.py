@@ -16,7 +16,7 @@ overwrite = 1   # When set the program deletes any existing databases.
 ### Parse the command line arguments
 parser = argparse.ArgumentParser(description="FUR database setup utility")
 # Command:
-parser.add_argument("action", help="Database action (create, export, delete, deduplicate or info)", action="store")
+parser.add_argument("action", help="Database action (create, append, export, delete, deduplicate, reindex, upgrade, refresh-stats or info)", action="store")
 # Arguments:
 parser.add_argument("-i","--input", help="Input filename", type=argparse.FileType('r'))
 parser.add_argument("-o","--output", help="Output filename", type=argparse.FileType('w'))
@@ -33,7 +33,21 @@ parser.add_argument("-f","--flankingoffset", help="Adds a margin before the flan
 parser.add_argument("-m","--mincontigsize", help="Minimum contig lengths", nargs=1, type=int)
 parser.add_argument("-n","--noalt", help="Discard alternative genome sequences on import", action="store_true")
 parser.add_argument("-e","--expdup", help="Expected number of duplicates (for use with concatenated psl files)", nargs=1, type=int)
+parser.add_argument("-b","--batchsize", help="Number of rows written per database transaction", nargs=1, type=int)
+parser.add_argument("-j","--jobs", help="Number of processes used to extract flanking regions and contigs (or run BLAT)", nargs=1, type=int)
+parser.add_argument("--blat", help="BLAT executable, used to identify duplicates when no --input file is given", action="store")
+parser.add_argument("--dedupmethod", help="Deduplication method when running BLAT (self, genome or both)", action="store")
+parser.add_argument("--engine", help="Deduplication engine used when no --input file is given (blat, kmer or track)", action="store")
+parser.add_argument("-k","--kmer", help="K-mer size used by the kmer deduplication engine", nargs=1, type=int)
+parser.add_argument("--direct", help="Create the unmasked contigs directly from the genome, without storing the flanking region sequences", action="store_true")
+parser.add_argument("--flankcoords", help="Store the flanking region positions when using --direct", action="store_true")
+parser.add_argument("--resume", help="Continue an interrupted create action, skipping the work already completed", action="store_true")
 parser.add_argument("-v","--verbose", help="Increased verbosity", action="store_true")
+parser.add_argument("--seqformat", help="Sequence storage format (text or packed)", action="store")
+parser.add_argument("--contigstorage", help="Contig table storage (sequence or coordinates)", action="store")
+parser.add_argument("--profile", help="SQLite connection profile (default, bulk or read)", action="store")
+parser.add_argument("--metrics", help="Metrics filename (the timing of each stage is appended as a JSON line)", type=argparse.FileType('a'))
+parser.add_argument("--tracemalloc", help="Record the peak Python memory allocated by each stage in the metrics file (slower)", action="store_true")
 
 # Any commands entered without a flag
 args = parser.parse_args()
@@ -86,6 +100,29 @@ if args.database:
 elif "database" in loadedarguments:
     database = loadedarguments.get("database").strip()
 
+profile = "default"
+if args.profile:
+    profile=args.profile.lower()
+elif "profile" in loadedarguments:
+    profile = loadedarguments.get("profile").strip().lower()
+if profile not in libFURdatabase.sqliteprofiles:
+    print("\nAccepted connection profile options are default, bulk or read.\n")
+    sys.exit()
+
+# Stage metrics (see libFURshared.measureStage)
+metricsfile = None
+if args.metrics:
+    metricsfile=args.metrics
+elif "metrics" in loadedarguments:
+    metricsfile = open(loadedarguments.get("metrics").strip(),'a')
+
+tracememory = 0
+if args.tracemalloc:
+    tracememory=1
+elif "tracemalloc" in loadedarguments:
+    tracememory = int(loadedarguments.get("tracemalloc"))
+libFURshared.setMetricsFile(metricsfile, tracememory)
+
 # Input and output files (NOTE: The command line interface reuses the input/output option so this should be passed at the prompt)
 inputfile = None
 if args.input:
@@ -143,12 +180,83 @@ if args.noalt:
 elif "noalt" in loadedarguments:
     noaltchr = int(loadedarguments.get("noalt"))
 
+blat = None
+if args.blat:
+    blat=args.blat
+elif "blat" in loadedarguments:
+    blat = loadedarguments.get("blat").strip()
+
+dedupmethod = "self"
+if args.dedupmethod:
+    dedupmethod=args.dedupmethod.lower()
+elif "dedupmethod" in loadedarguments:
+    dedupmethod = loadedarguments.get("dedupmethod").strip().lower()
+
+engine = "blat"
+if args.engine:
+    engine=args.engine.lower()
+elif "engine" in loadedarguments:
+    engine = loadedarguments.get("engine").strip().lower()
+
+kmer = libFURdatabase.kmerdefault
+if args.kmer:
+    kmer=args.kmer[0]
+elif "kmer" in loadedarguments:
+    kmer = int(loadedarguments.get("kmer"))
+
+direct = 0
+if args.direct:
+    direct=1
+elif "direct" in loadedarguments:
+    direct = int(loadedarguments.get("direct"))
+
+flankcoords = 0
+if args.flankcoords:
+    flankcoords=1
+elif "flankcoords" in loadedarguments:
+    flankcoords = int(loadedarguments.get("flankcoords"))
+
+resume = 0
+if args.resume:
+    resume=1
+elif "resume" in loadedarguments:
+    resume = int(loadedarguments.get("resume"))
+
 expdup=1
 if args.expdup:
     expdup=args.expdup[0]
 elif "expdup" in loadedarguments:
     expdup = int(loadedarguments.get("expdup"))
 
+batchsize = libFURdatabase.batchdefault
+if args.batchsize:
+    batchsize=args.batchsize[0]
+elif "batchsize" in loadedarguments:
+    batchsize = int(loadedarguments.get("batchsize"))
+jobs = 1
+if args.jobs:
+    jobs=args.jobs[0]
+elif "jobs" in loadedarguments:
+    jobs = int(loadedarguments.get("jobs"))
+
+seqformat = None
+if args.seqformat:
+    seqformat=args.seqformat.lower()
+elif "seqformat" in loadedarguments:
+    seqformat = loadedarguments.get("seqformat").strip().lower()
+if seqformat and seqformat not in libFURdatabase.sequenceformats:
+    print("\nAccepted sequence format options are text or packed.\n")
+    sys.exit()
+
+contigstorage = None
+if args.contigstorage:
+    contigstorage=args.contigstorage.lower()
+elif "contigstorage" in loadedarguments:
+    contigstorage = loadedarguments.get("contigstorage").strip().lower()
+if contigstorage and contigstorage not in libFURdatabase.contigstorageformats:
+    print("\nAccepted contig storage options are sequence or coordinates.\n")
+    sys.exit()
+
 # Check which command has been requested
 if args.action.lower()=="create":
     # Create the database and load the flanking sequences
@@ -168,43 +276,198 @@ if args.action.lower()=="create":
         if filetype not in ["BED", "DFAM", "UCSC"]:
             print("\nAccepted annotation file type options are BED, DFAM or UCSC.\n")
             sys.exit()
+    if direct and libFURdatabase.contigstorageformats.get(contigstorage, 0) == 1:
+        print("\nThe direct option requires the sequence contig storage format (coordinates are retrieved from the flanking region sequences).\n")
+        sys.exit()
     # Perform the action
-    # Create database
-    if verbosity:
-        print("Creating database")
-    libFURdatabase.createDB(username,password,hostname,database, overwrite)
+    # Create database (unless resuming an existing database)
+    if resume and libFURdatabase.databaseExists(username,password,hostname,database):
+        if verbosity:
+            print("Resuming database creation")
+    else:
+        resume = 0
+        if verbosity:
+            print("Creating database")
+        libFURdatabase.createDB(username,password,hostname,database, overwrite, libFURdatabase.sequenceformats.get(seqformat, 0), libFURdatabase.contigstorageformats.get(contigstorage, 0))
     # Connect to database
     if verbosity:
         print("- Connecting to database, "+database)
-    databaseobj = libFURdatabase.database(username,password,hostname,database, verbosity)
+    databaseobj = libFURdatabase.database(username,password,hostname,database, verbosity, profile)
+    # Stages already completed (recorded in the coverage table) are skipped when resuming
+    completed = {}
+    if resume:
+        databaseobj.upgradeSchema()
+        completed = databaseobj.stageCoverage()
     # Populate annotation table
+    if "annotations" not in completed:
+        if verbosity:
+            print("- Populating annotation table, with "+filetype+" file "+inputfile.name)
+        databaseobj.populateAnnotations(inputfile, filetype, batchsize, resume)
+    databaseobj.createIndexes(["annotations"])
+    if direct:
+        # Populate unmasked contigs table directly from the genome
+        if "UnmaskedContigs" not in completed:
+            if verbosity:
+                print("- Populating unmasked region table directly, using file "+genomefile.name+" with a flanking region size of "+str(flankingsize)+"bp offset by "+str(flankingoffset)+"bp and a minimum contig size of "+str(mincontigsize)+"bp")
+            databaseobj.populateContigsDirect(genomefile, flankingsize, flankingoffset, mincontigsize, batchsize, jobs, flankcoords, 0, resume)
+    else:
+        # Populate flanking region table
+        if "flanking" not in completed:
+            if verbosity:
+                print("- Populating flanking region table, using file "+genomefile.name+" with a size of "+str(flankingsize)+"bp offset by "+str(flankingoffset)+"bp")
+            databaseobj.populateFlankingRegions(genomefile, flankingsize, flankingoffset, batchsize, jobs, 0, resume)
+        # Populate unmasked contigs table
+        if "UnmaskedContigs" not in completed:
+            if verbosity:
+                print("- Populating unmasked region table, using a minimum contig size of "+str(mincontigsize)+"bp")
+            databaseobj.populateUnmaskedContigs(mincontigsize, batchsize, jobs, 0, resume)
+    # Build the indexes on the populated tables
     if verbosity:
-        print("- Populating annotation table, with "+filetype+" file "+inputfile.name)
-    databaseobj.populateAnnotations(inputfile, filetype)
-    # Populate flanking region table
+        print("- Indexing tables")
+    databaseobj.createIndexes(["flanking", "UnmaskedContigs"])
+elif args.action.lower()=="append":
+    # Add annotations to an existing database, processing only the new annotations (using the flanking region and contig sizes the database was created with)
+    # Check the required inputs:
+    if not inputfile:
+        print("Annotation file required (missing --input option)")
+        sys.exit()
+    if not genomefile:
+        print("Genome file required (missing --genome option)")
+        sys.exit()
+    if not filetype:
+        filetype = libFURshared.detectFileType(inputfile)
+        if not filetype:
+            print("\nInput file type could not be detected, please specify using the type argument.\n")
+            sys.exit()
+    else:
+        if filetype not in ["BED", "DFAM", "UCSC"]:
+            print("\nAccepted annotation file type options are BED, DFAM or UCSC.\n")
+            sys.exit()
+    if engine not in ["blat", "kmer", "track"]:
+        print("\nAccepted deduplication engines are blat, kmer or track.\n")
+        sys.exit()
+    if engine in ["kmer", "track"] and kmer > 31:
+        print("\nThe kmer and track engines support k-mers of up to 31 bases.\n")
+        sys.exit()
+    # Connect to database
     if verbosity:
-        print("- Populating flanking region table, using file "+genomefile.name+" with a size of "+str(flankingsize)+"bp offset by "+str(flankingoffset)+"bp")
-    databaseobj.populateFlankingRegions(genomefile, flankingsize, flankingoffset)
-    # Populate unmasked contigs table
+        print("- Connecting to database, "+database)
+    databaseobj = libFURdatabase.database(username,password,hostname,database, verbosity, profile)
+    # The coverage of each stage is recorded from schema version 3 (and the deduplication method from version 6)
+    databaseobj.upgradeSchema()
+    if direct and databaseobj.contigstorage == 1:
+        print("\nThe direct option requires the sequence contig storage format (coordinates are retrieved from the flanking region sequences).\n")
+        sys.exit()
+    dbschema, flankingsize, flankingoffset, mincontigsize = databaseobj.databaseInfo()
+    # If the database has been deduplicated, the new contigs are deduplicated using the method recorded (checked before any annotations are added)
+    deduplicated = "DeduplicatedContigs" in databaseobj.stageCoverage()
+    appendmethod = databaseobj.dedupMethod()
+    if deduplicated:
+        appendmethodname = {value: name for name, value in libFURdatabase.dedupmethods.items()}.get(appendmethod)
+        if not appendmethodname:
+            print("\nThe deduplication method used by this database is not recorded (deduplicated from a PSL file, or before the method was recorded). Delete the DeduplicatedContigs table before appending, and deduplicate again once the annotations have been added.\n")
+            sys.exit()
+        if engine == "track" and appendmethodname != "genome":
+            print("\nThe database was deduplicated using the "+appendmethodname+" method, the track engine only matches contigs against the genome (use --engine kmer or blat).\n")
+            sys.exit()
+    # Populate annotation table
     if verbosity:
-        print("- Populating unmasked region table, using a minimum contig size of "+str(mincontigsize)+"bp")
-    databaseobj.populateUnmaskedContigs(mincontigsize)
+        print("- Adding to annotation table, with "+filetype+" file "+inputfile.name)
+    firstid = databaseobj.populateAnnotations(inputfile, filetype, batchsize)
+    if direct:
+        # Add the unmasked contigs of the new annotations directly from the genome
+        if verbosity:
+            print("- Adding to unmasked region table directly, using file "+genomefile.name+" with a flanking region size of "+str(flankingsize)+"bp offset by "+str(flankingoffset)+"bp and a minimum contig size of "+str(mincontigsize)+"bp")
+        databaseobj.populateContigsDirect(genomefile, flankingsize, flankingoffset, mincontigsize, batchsize, jobs, flankcoords, firstid)
+    else:
+        # Add the flanking regions and unmasked contigs of the new annotations
+        if verbosity:
+            print("- Adding to flanking region table, using file "+genomefile.name+" with a size of "+str(flankingsize)+"bp offset by "+str(flankingoffset)+"bp")
+        databaseobj.populateFlankingRegions(genomefile, flankingsize, flankingoffset, batchsize, jobs, firstid)
+        if verbosity:
+            print("- Adding to unmasked region table, using a minimum contig size of "+str(mincontigsize)+"bp")
+        databaseobj.populateUnmaskedContigs(mincontigsize, batchsize, jobs, firstid)
+    # If the database has been deduplicated, deduplicate the new contigs using the same method
+    if deduplicated:
+        if verbosity:
+            print("- Adding to deduplicated contigs table, matching the new contigs ("+appendmethodname+", "+engine+") with a minimum contig size of "+str(mincontigsize))
+        if engine == "kmer":
+            databaseobj.deduplicateKmers(appendmethod, genomefile.name, mincontigsize, noaltchr, jobs, kmer, batchsize, firstid)
+        elif engine == "track":
+            databaseobj.deduplicateTrack(genomefile.name, mincontigsize, noaltchr, jobs, kmer, batchsize, firstid)
+        elif blat:
+            try:
+                databaseobj.deduplicateBLAT(blat, appendmethod, genomefile.name, mincontigsize, noaltchr, jobs, batchsize, firstid)
+            except (OSError, RuntimeError) as error:
+                print("\nDeduplication failed: "+str(error)+"\n")
+                sys.exit()
+        else:
+            print("WARNING: The new contigs have not been deduplicated (missing --blat option, or use --engine kmer or track)")
+    # Build any indexes missing from the tables
+    databaseobj.createIndexes()
 elif args.action.lower()=="deduplicate":
     # Create a table with duplicate entries removed
     # Check the required inputs:
-    if not inputfile:
-        print("Deduplication file required (missing --input option)")
+    if engine not in ["blat", "kmer", "track"]:
+        print("\nAccepted deduplication engines are blat, kmer or track.\n")
         sys.exit()
+    if not inputfile and engine == "track":
+        if not genomefile:
+            print("Genome file required (missing --genome option)")
+            sys.exit()
+    if not inputfile and engine in ["kmer", "track"] and kmer > 31:
+        print("\nThe kmer and track engines support k-mers of up to 31 bases.\n")
+        sys.exit()
+    if not inputfile and engine == "blat" and not blat:
+        print("Deduplication file required (missing --input option), or the BLAT executable to identify duplicates (missing --blat option)")
+        sys.exit()
+    if not inputfile and engine != "track":
+        if dedupmethod not in libFURdatabase.dedupmethods:
+            print("\nAccepted deduplication methods are self, genome or both.\n")
+            sys.exit()
+        if dedupmethod != "self" and not genomefile:
+            print("Genome file required (missing --genome option)")
+            sys.exit()
     # Connect to database
     if verbosity:
         print("- Connecting to database, "+database)
-    databaseobj = libFURdatabase.database(username,password,hostname,database, verbosity)
+    databaseobj = libFURdatabase.database(username,password,hostname,database, verbosity, profile)
     # Populate deduplication table
-    if verbosity:
-        print("- Populating deduplicated contigs table, from "+inputfile.name+" with a minimum contig size of "+mincontigsize)
-        if noaltchr == 1:
-            print("-- Duplicates on chromosomes ending in '_alt' are being ignored.")
-    databaseobj.populateDeduplicatedContigs(inputfile, mincontigsize, noaltchr, expdup)
+    if inputfile:
+        if verbosity:
+            print("- Populating deduplicated contigs table, from "+inputfile.name+" with a minimum contig size of "+str(mincontigsize))
+            if noaltchr == 1:
+                print("-- Duplicates on chromosomes ending in '_alt' are being ignored.")
+        databaseobj.populateDeduplicatedContigs(inputfile, mincontigsize, noaltchr, expdup, batchsize)
+    elif engine == "kmer":
+        if verbosity:
+            print("- Populating deduplicated contigs table, using "+str(kmer)+"-mers ("+dedupmethod+") with a minimum contig size of "+str(mincontigsize))
+            if noaltchr == 1:
+                print("-- Chromosomes ending in '_alt' are being ignored.")
+        genomefilename = None
+        if genomefile:
+            genomefilename = genomefile.name
+        databaseobj.deduplicateKmers(libFURdatabase.dedupmethods.get(dedupmethod), genomefilename, mincontigsize, noaltchr, jobs, kmer, batchsize)
+    elif engine == "track":
+        if verbosity:
+            print("- Populating deduplicated contigs table, using the "+str(kmer)+"-mer mappability track of "+genomefile.name+" with a minimum contig size of "+str(mincontigsize))
+            if noaltchr == 1:
+                print("-- Chromosomes ending in '_alt' are being ignored.")
+        databaseobj.deduplicateTrack(genomefile.name, mincontigsize, noaltchr, jobs, kmer, batchsize)
+    else:
+        if verbosity:
+            print("- Populating deduplicated contigs table, using BLAT ("+dedupmethod+") with a minimum contig size of "+str(mincontigsize))
+            if noaltchr == 1:
+                print("-- Duplicates on chromosomes ending in '_alt' are being ignored.")
+        genomefilename = None
+        if genomefile:
+            genomefilename = genomefile.name
+        try:
+            databaseobj.deduplicateBLAT(blat, libFURdatabase.dedupmethods.get(dedupmethod), genomefilename, mincontigsize, noaltchr, jobs, batchsize)
+        except (OSError, RuntimeError) as error:
+            print("\nDeduplication failed: "+str(error)+"\n")
+            sys.exit()
+    databaseobj.createIndexes(["DeduplicatedContigs"])
 elif args.action.lower()=="delete":
     # Delete contents from a table
     # Check the required inputs:
@@ -214,7 +477,7 @@ elif args.action.lower()=="delete":
     # Connect to database
     if verbosity:
         print("- Connecting to database, "+database)
-    databaseobj = libFURdatabase.database(username,password,hostname,database, verbosity)
+    databaseobj = libFURdatabase.database(username,password,hostname,database, verbosity, profile)
     # Remove all entries from the table
     if verbosity:
         print("- Removing all entries from "+tablename+" table")
@@ -228,23 +491,64 @@ elif args.action.lower()=="export":
     # Connect to database
     if verbosity:
         print("- Connecting to database, "+database)
-    databaseobj = libFURdatabase.database(username,password,hostname,database, verbosity)
+    databaseobj = libFURdatabase.database(username,password,hostname,database, verbosity, profile)
     # Export the table
     if verbosity:
         print("- Exporting sequences in "+tablename+" table to "+outputfile.name+" (FASTA format)")
     databaseobj.exportStoredSequences(outputfile, tablename)
+elif args.action.lower()=="reindex":
+    # Rebuild the secondary indexes (creating any which are missing from older databases)
+    # Connect to database
+    if verbosity:
+        print("- Connecting to database, "+database)
+    databaseobj = libFURdatabase.database(username,password,hostname,database, verbosity, profile)
+    # Rebuild the indexes
+    if verbosity:
+        print("- Rebuilding table indexes")
+    databaseobj.createIndexes(None, 1)
+elif args.action.lower()=="upgrade":
+    # Update a database created by an older version and optionally change the sequence or contig storage format
+    # Connect to database
+    if verbosity:
+        print("- Connecting to database, "+database)
+    databaseobj = libFURdatabase.database(username,password,hostname,database, verbosity, profile)
+    databaseobj.upgradeSchema()
+    if seqformat:
+        if verbosity:
+            print("- Converting stored sequences to the "+seqformat+" format")
+        databaseobj.convertSequenceFormat(libFURdatabase.sequenceformats.get(seqformat), batchsize)
+    if contigstorage:
+        if verbosity:
+            print("- Converting contig tables to store "+contigstorage)
+        databaseobj.convertContigStorage(libFURdatabase.contigstorageformats.get(contigstorage), batchsize)
+elif args.action.lower()=="refresh-stats":
+    # Recount the table statistics reported by info (ie. if the tables have been changed outside of FURdb)
+    # Connect to database
+    if verbosity:
+        print("- Connecting to database, "+database)
+    databaseobj = libFURdatabase.database(username,password,hostname,database, verbosity, profile)
+    if verbosity:
+        print("- Counting table rows and base pairs")
+    databaseobj.refreshStats()
 elif args.action.lower()=="info":
     # Display basic information on the database for diagnosis purposes
     # Connect to database
     if verbosity:
         print("- Connecting to database, "+database)
-    databaseobj = libFURdatabase.database(username,password,hostname,database, verbosity)
+    databaseobj = libFURdatabase.database(username,password,hostname,database, verbosity, profile)
     # Displaying basic table statistics
     tableinfo = databaseobj.tablesizes()
     print("\nDatabase information for "+database)
     for table in tableinfo:
         print("Table: "+table[0]+" has "+str(table[1])+" entries and contains "+str(table[2])+"bp of sequence.")
+    coverage = databaseobj.stageCoverage()
+    for stage in libFURdatabase.stages:
+        if stage in coverage:
+            print("Stage: "+stage+" covers annotations "+", ".join([str(firstid)+"-"+str(lastid) for firstid, lastid in coverage.get(stage)])+".")
+    methodnames = {value: name for name, value in libFURdatabase.dedupmethods.items()}
+    if databaseobj.dedupMethod() in methodnames:
+        print("Deduplication method: "+methodnames.get(databaseobj.dedupMethod())+".")
     print()
 else:
     print("ERROR: Invalid action")
-    print("Valid options are: create, deduplicate, delete, export and info.")
+    print("Valid options are: create, append, deduplicate, delete, export, reindex, upgrade, refresh-stats and info.")
@@ -57,6 +57,7 @@ class ConnectDB(QtWidgets.QWidget):
         # Create a FUR database object
         ### TODO: Check database field is not empty
         ### TODO: Check if the database connection was successful
+        libFURdatabase.connections.closeDatabase(server,database)   # Reread the database details when reconnecting
         databaseobj = libFURdatabase.database(username,password,server,database,0)
         # Display the main database window
         self.main = MainWindow(databaseobj)
@@ -183,6 +184,7 @@ class CreateDB(QtWidgets.QWidget):
         inputfile = open(AnnoFileLoc,'r')
         filetype = libFURshared.detectFileType(inputfile)
         databaseobj.populateAnnotations(inputfile, filetype)
+        databaseobj.createIndexes(["annotations"])
         self.create.ConnectionStatus.setText("Populating database with flanking regions...")
         self.create.ConnectionStatus.repaint()
         genomefile = open(GenomeFileLoc,'r')
@@ -190,36 +192,12 @@ class CreateDB(QtWidgets.QWidget):
         self.create.ConnectionStatus.setText("Removing softmasked sequence...")
         self.create.ConnectionStatus.repaint()
         databaseobj.populateUnmaskedContigs(int(MinContigSize))
-        self.create.ConnectionStatus.setText("Exporting flanking regions for deduplication...")
+        databaseobj.createIndexes(["flanking", "UnmaskedContigs"])
+        self.create.ConnectionStatus.setText("Running BLAT match identification and performing deduplication...")
         self.create.ConnectionStatus.repaint()
-        exportfileName = "UnmaskedContigs.fasta"
-        exportfile = open(exportfileName,'w')
-        tablename = "UnmaskedContigs"
-        databaseobj.exportStoredSequences(exportfile, tablename)
-        self.create.ConnectionStatus.setText("Running BLAT match identification...")
-        self.create.ConnectionStatus.repaint()
-        commandtmp = "{} {} {} blatmatches.psl"
-        if self.DedupMethod==2:
-            commandstr = commandtmp.format(BLATFileLoc, GenomeFileLoc, exportfileName)
-        else:
-            commandstr = commandtmp.format(BLATFileLoc, exportfileName, exportfileName)
-        print(commandstr)
-        subprocess.call(commandstr, shell=True)
-        if self.DedupMethod==3:
-            commandtmp2 = "{} {} {} blatmatchesPt2.psl -noHead"
-            commandstr2 = commandtmp2.format(BLATFileLoc, GenomeFileLoc, exportfileName)
-            subprocess.call(commandstr2, shell=True)
-            command = "cat blatmatches.psl blatmatchesPt2.psl > blatmatchesBoth.psl"
-            subprocess.call(command, shell=True)
-        self.create.ConnectionStatus.setText("Importing BLAT results and performing deduplication...")
-        self.create.ConnectionStatus.repaint()
-        if self.DedupMethod==3:
-            importfile = open("blatmatchesBoth.psl",'r')
-            databaseobj.populateDeduplicatedContigs(importfile, int(MinContigSize), 0, 2)
-        else:
-            importfile = open("blatmatches.psl",'r')
-            databaseobj.populateDeduplicatedContigs(importfile, int(MinContigSize), 0, 1)
-        # TODO: Remove temporary files
+        # BLAT is run on shards of the unmasked contigs, one process per CPU
+        databaseobj.deduplicateBLAT(BLATFileLoc, self.DedupMethod, GenomeFileLoc, int(MinContigSize), 0, os.cpu_count() or 1)
+        databaseobj.createIndexes(["DeduplicatedContigs"])
         # Open next window
         self.main = MainWindow(databaseobj)
         self.main.show()
@@ -232,6 +210,10 @@ class MainWindow(QtWidgets.QMainWindow):
     def __init__(self, databaseobj=None):
         super().__init__()
         self.databaseobj = None
+        self.inspectobj = None      # Inspection object shared by the windows opened from this window
+        self.analysisobj = None     # Analysis object reused by each analysis (keeping the contig ends calculated on creation)
+        self.annoview = None        # Annotation and contig windows opened from this window (closed with the connections they use)
+        self.contigview = None
         # Populate QWidget with UI design
         self.ui = Ui_MainWindow()
         self.ui.setupUi(self)
@@ -278,21 +260,44 @@ class MainWindow(QtWidgets.QMainWindow):
     def quitProgram(self):
         self.close()
 
+    def closeEvent(self, event):
+        # Release the shared database connections however the window is closed
+        self.closeConnections()
+        super().closeEvent(event)
+
     def viewAnno(self):
-        # Pass the ID number and inspectionobj:
-        inspectobj = libFURinspect.inspect(self.username,self.password,self.server,self.database,0)
+        # Pass the ID number and the shared inspectionobj:
         id = int(self.ui.idEntry.text())
-        self.annoview = AnnoWindow(id, inspectobj)
+        self.annoview = AnnoWindow(id, self.inspection())
         self.annoview.show()
-        inspectobj.close()
 
     def viewContig(self):
-        # Pass the ID number and inspectionobj:
-        inspectobj = libFURinspect.inspect(self.username,self.password,self.server,self.database,0)
+        # Pass the ID number and the shared inspectionobj:
         id = int(self.ui.idEntry.text())
-        self.contigview = ContigWindow(id, inspectobj)
+        self.contigview = ContigWindow(id, self.inspection())
         self.contigview.show()
-        inspectobj.close()
+
+    def inspection(self):
+        """Returns the shared inspection object, connecting to the database if required"""
+        if not self.inspectobj:
+            self.inspectobj = libFURinspect.inspect(self.username,self.password,self.server,self.database,0)
+        return self.inspectobj
+
+    def closeConnections(self):
+        """Release the connections of the shared inspection and analysis objects"""
+        # Close the windows using the shared inspection object first
+        if self.annoview:
+            self.annoview.close()
+            self.annoview = None
+        if self.contigview:
+            self.contigview.close()
+            self.contigview = None
+        if self.inspectobj:
+            self.inspectobj.close()
+            self.inspectobj = None
+        if self.analysisobj:
+            self.analysisobj.close()
+            self.analysisobj = None
 
     def populateInfo(self):
         """Populate the text fields with the database information"""
@@ -335,10 +340,8 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def populateInspect(self):
         """Populate the inspect tab with the list of available annotations"""
-        # Connect
-        inspectobj = libFURinspect.inspect(self.username,self.password,self.server,self.database,0)
-        # Run commands
-        annoTableRaw = inspectobj.annoDetails("ALL")
+        # Run commands (the inspection object is kept and shared with the annotation and contig windows)
+        annoTableRaw = self.inspection().annoDetails("ALL")
         # If the information is available add additional columns on the flanking regions
         if self.regionCounts:
             newannoTableRaw = []
@@ -389,8 +392,6 @@ class MainWindow(QtWidgets.QMainWindow):
         self.ui.tableWidget.resizeColumnsToContents()
         # Update the selected ID field
         self.ui.tableWidget.itemSelectionChanged.connect(self.updateInspectID)
-        # Close connection
-        inspectobj.close()
         # Set selection behaviour to select the entire row.
         self.ui.tableWidget.setSelectionBehavior(QtWidgets.QTableView.SelectRows)
         # Store the table, so we can add an export function later
@@ -426,8 +427,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.ui.CalcQualButton.repaint()
         # Use the inspection functions to generate the database quality details
         # WARNING: This significantly slows application startup!
-        inspectobj = libFURinspect.inspect(self.username,self.password,self.server,self.database,0)
-        overlappingRegions = inspectobj.overlappingAnnos()
+        overlappingRegions = self.inspection().overlappingAnnos()
         # To calculate the number of affected annotations:
         annosAffected = []
         for entry in overlappingRegions:
@@ -439,8 +439,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.ui.OverlappingLab.setText(overlaptext)
         self.ui.OverlappingLab.repaint()    # Added so this field displays as soon as this process is finished
         # Display information on the annotations with no regions:
-        regionCounts = inspectobj.regionCount()
-        inspectobj.close()
+        regionCounts = self.inspection().regionCount()
         senseNullCount = 0
         antiNullCount = 0
         bothNullCount = 0
@@ -560,10 +559,11 @@ class MainWindow(QtWidgets.QMainWindow):
         else:
             fixed=0
         # Export the sequences
-        analysisobj = libFURanalysis.analysis(self.username,self.password,self.server,self.database,0)
+        if not self.analysisobj:
+            self.analysisobj = libFURanalysis.analysis(self.username,self.password,self.server,self.database,0)
         tablename = "DeduplicatedContigs"
-        analysisobj.setTableVar(tablename)
-        analysisobj.exportSequencesAdv(exportFile,orientation, end, equal, largest, fixed, closest)
+        self.analysisobj.setTableVar(tablename)
+        self.analysisobj.exportSequencesAdv(exportFile,orientation, end, equal, largest, fixed, closest)
         exportFile.close()
         ## Perform alignment
         self.ui.AnalysisStatusLab.setText("Aligning transcriptome to FURdb sequences...")
@@ -621,7 +621,7 @@ class MainWindow(QtWidgets.QMainWindow):
                 name = os.path.split(name)[1]
                 OutputName = OutputName+name.split('.')[0]+".tsv"  # Not configurable atm
                 OutputFile = open(OutputName,'w')
-                samalignobj = libFURanalysis.alignfile(analysisobj,open(SamName),Quality,all)
+                samalignobj = libFURanalysis.alignfile(self.analysisobj,open(SamName),Quality,all)
                 extension = OutputName.split('.')[-1]
                 if extension.lower() == "gtf":      # Further extend for .count
                     libFURanalysis.reportGTF(samalignobj,OutputFile,header)
@@ -629,14 +629,13 @@ class MainWindow(QtWidgets.QMainWindow):
                     libFURanalysis.reportAll(samalignobj,OutputFile,header)
         else:
             OutputFile = open(OutputName,'w')
-            samalignobj = libFURanalysis.alignfile(analysisobj,open(SamName),Quality,all)
+            samalignobj = libFURanalysis.alignfile(self.analysisobj,open(SamName),Quality,all)
             extension = OutputName.split('.')[-1]
             if extension.lower() == "gtf":      # Further extend for .count
                 libFURanalysis.reportGTF(samalignobj,OutputFile,header)
             else:
                 libFURanalysis.reportAll(samalignobj,OutputFile,header)
-        analysisobj.close()
-        # Close database connection and tidy up
+        # Tidy up (the analysis object and its connection are kept for the next analysis)
         self.ui.AnalysisStatusLab.setText("Analysis completed")
         self.ui.AnalysisStatusLab.repaint()
 
@@ -715,17 +714,22 @@ class ContigWindow(QtWidgets.QWidget):
         except:
             self.id = None
         self.inspectobj = inspectobj
+        self.annoview = None    # Annotation window opened from this window
         self.updateInfo()
 
     # Interface functions
     def closeWindow(self):
         self.close()
+    def closeEvent(self, event):
+        # The annotation window shares the inspection object, so is closed with this window
+        if self.annoview:
+            self.annoview.close()
+            self.annoview = None
+        super().closeEvent(event)
     def viewAnno(self):
         if self.id:
-            inspectobj = libFURinspect.inspect(self.inspectobj.SQLuser,self.inspectobj.SQLpass,self.inspectobj.SQLhost,self.inspectobj.SQLdb,0)
-            self.annoview = AnnoWindow(self.AnnoID,inspectobj)   # Open annotation window (Requires updateInfo to be run first)
+            self.annoview = AnnoWindow(self.AnnoID,self.inspectobj)   # Open annotation window (Requires updateInfo to be run first)
             self.annoview.show()
-            inspectobj.close()
     def updateInfo(self):
         # Update the ID number
         idText = self.contigui.idLab.text()
@@ -769,9 +773,7 @@ class ContigWindow(QtWidgets.QWidget):
             outLoc = QtWidgets.QFileDialog.getSaveFileName(self, 'Save sequence as...','','')
             if outLoc[0]:      # Probably incorrect way to prevent further code execution if the dialog box is cancelled.
                 # Get the sequence
-                inspectobj = libFURinspect.inspect(self.inspectobj.SQLuser,self.inspectobj.SQLpass,self.inspectobj.SQLhost,self.inspectobj.SQLdb,0)
-                sequence = inspectobj.exportSequenceSingle(self.id,tablename)
-                inspectobj.close()
+                sequence = self.inspectobj.exportSequenceSingle(self.id,tablename)
                 # Write out the sequence
                 saveFile = open(outLoc[0],'w')
                 libFURshared.exportFASTAEntry(saveFile,str(self.id),sequence)
@@ -0,0 +1,78 @@
+# Benchmark of the annotation parser against the Annotation class
+# Run from the repository root: python -m benchmarks.bench_annotationParser [-l LINES]
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from lib import libFURshared
+
+# UCSC RepeatMasker (rmsk) table columns
+ucscheader = ["#bin", "swScore", "milliDiv", "milliDel", "milliIns", "genoName", "genoStart", "genoEnd", "genoLeft", "strand", "repName", "repClass", "repFamily", "repStart", "repEnd", "repLeft", "id"]
+repeats = [("L1HS", "LINE", "L1", 6064), ("L1PA2", "LINE", "L1", 6163), ("AluY", "SINE", "Alu", 311), ("MIR", "SINE", "MIR", 262), ("THE1B", "LTR", "ERVL-MaLR", 363)]
+
+# Writes a RepeatMasker table of random annotations
+# INPUT: File object (opened for writing), number of annotations and random seed
+def writeUcscTable(fileobj, lines, seed=2):
+    """Writes a UCSC RepeatMasker table with the given number of annotations"""
+    randomobj = random.Random(seed)
+    fileobj.write("\t".join(ucscheader)+"\n")
+    position = 10000
+    for i in range(lines):
+        repName, repClass, repFamily, repLength = randomobj.choice(repeats)
+        length = randomobj.randint(50, repLength)
+        repStart = randomobj.randint(1, repLength-length+1)
+        repEnd = repStart+length-1
+        if randomobj.random() < 0.5:
+            strand = "+"
+            starts = [str(repStart), str(repEnd), str(repEnd-repLength)]
+        else:
+            strand = "-"
+            starts = [str(repEnd-repLength), str(repEnd), str(repStart)]
+        fileobj.write("\t".join([str(585+i//100000), str(randomobj.randint(200, 50000)), "13", "6", "17", "chr"+str(1+i//200000), str(position), str(position+length), "-248945954", strand, repName, repClass, repFamily]+starts+[str(i+1)])+"\n")
+        position += length+randomobj.randint(0, 2000)
+
+# Parses the table with the Annotation class, as populateAnnotations did before the annotation parser (user-002)
+def parseWithAnnotation(fileobj, type):
+    """Returns the number of annotations parsed with the Annotation class"""
+    header = fileobj.readline()
+    count = 0
+    for line in fileobj:
+        libFURshared.Annotation(line, type, header)
+        count += 1
+    return count
+
+# Parses the table with the annotation parser
+def parseWithParser(fileobj, type):
+    """Returns the number of annotations parsed with parseAnnotations"""
+    count = 0
+    for record in libFURshared.parseAnnotations(fileobj, type):
+        count += 1
+    return count
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Times the annotation parser against the Annotation class on a generated RepeatMasker table")
+    parser.add_argument("-l","--lines", help="Number of annotations in the table (default 2000000)", type=int, default=2000000)
+    parser.add_argument("-r","--repeats", help="Number of times each parser is timed, the fastest is reported (default 1)", type=int, default=1)
+    args = parser.parse_args()
+    fd, filename = tempfile.mkstemp(suffix=".txt")
+    try:
+        with os.fdopen(fd, 'w') as fileobj:
+            writeUcscTable(fileobj, args.lines)
+        results = {}
+        for name, function in [("Annotation class", parseWithAnnotation), ("annotationParser", parseWithParser)]:
+            best = None
+            for i in range(args.repeats):
+                with open(filename, 'r') as fileobj:
+                    start = time.perf_counter()
+                    count = function(fileobj, "UCSC")
+                    elapsed = time.perf_counter()-start
+                if best is None or elapsed < best:
+                    best = elapsed
+            results[name] = best
+            print(name+": "+str(count)+" annotations in "+format(best, ".2f")+"s ("+format(count/best, ",.0f")+" lines/s)")
+        print("Speedup: "+format(results["Annotation class"]/results["annotationParser"], ".2f")+"x")
+    finally:
+        os.remove(filename)
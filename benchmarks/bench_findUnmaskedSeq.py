@@ -0,0 +1,36 @@
+# Benchmark of findUnmaskedSeq against the loop it replaced, on the random soft-masked sequences used by the tests
+# Run from the repository root: python -m benchmarks.bench_findUnmaskedSeq [-c COUNT] [-n NUMBER]
+
+import argparse
+import time
+
+from lib import libFURdatabase
+from tests.test_libFURdatabase import randomSoftMaskedSequences, referenceFindUnmaskedSeq
+
+# Times a region search over all the sequences
+# INPUT: Function to time, list of (sequence, minimum size) pairs and number of passes over the list
+# OUTPUT: Fastest time (seconds) of a single pass
+def timeSearch(function, sequences, number):
+    """Returns the fastest time taken to search all the sequences"""
+    best = None
+    for i in range(number):
+        start = time.perf_counter()
+        for sequence, minsize in sequences:
+            function(sequence, minsize)
+        elapsed = time.perf_counter()-start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Times findUnmaskedSeq against the loop it replaced")
+    parser.add_argument("-c","--count", help="Number of random sequences (default 2000, as in the tests)", type=int, default=2000)
+    parser.add_argument("-n","--number", help="Number of passes over the sequences, the fastest is reported (default 20)", type=int, default=20)
+    args = parser.parse_args()
+    sequences = list(randomSoftMaskedSequences(args.count))
+    bases = sum(len(sequence) for sequence, minsize in sequences)
+    results = {}
+    for name, function in [("Reference loop", referenceFindUnmaskedSeq), ("findUnmaskedSeq", libFURdatabase.findUnmaskedSeq)]:
+        results[name] = timeSearch(function, sequences, args.number)
+        print(name+": "+str(len(sequences))+" sequences ("+str(bases)+" bases) in "+format(results[name]*1000, ".2f")+"ms ("+format(bases/results[name], ",.0f")+" bases/s)")
+    print("Speedup: "+format(results["Reference loop"]/results["findUnmaskedSeq"], ".2f")+"x")
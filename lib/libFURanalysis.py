@@ -10,36 +10,42 @@ import operator
 class analysis(libFURdatabase.furdbobj):
     """Analysis class which interacts with the FUR database to export and lookup information"""
     # Inherited object creation functions
-    def __init__(self, SQLuser, SQLpass, SQLhost="localhost", SQLdb="FURdb", verbosity=0):
+    def __init__(self, SQLuser, SQLpass, SQLhost="localhost", SQLdb="FURdb", verbosity=0, profile="default"):
         """Create the object, set verbosity and connect it to the SQL database."""
         # Inherit the shared functions from a shared parent class
-        super().__init__(SQLuser, SQLpass, SQLhost, SQLdb, verbosity)
+        super().__init__(SQLuser, SQLpass, SQLhost, SQLdb, verbosity, profile)
         self.setTableVar()
         self.calcContigEnds()   # These values are needed frequently so calculate once on creation
     ### Functions relating to the setting of commonly used object variables which are unlikely to change between object calls
     def setTableVar(self, table="DeduplicatedContigs"):
         """Set the table to use for analysis"""
         self.table = table
-    # Returns two lists which can be used to identify if a contig is at the sense or antisense end of an annotation
+    # Returns two sets which can be used to identify if a contig is at the sense or antisense end of an annotation
+    # NOTE: The sets are cached with the database details, so objects using the same database (ie. in the user interface) only calculate them once.
     def calcContigEnds(self):
-        """Returns a list of contigs at the sense end and a list of those at the antisense end of their annotations"""
-        senseList = []
-        antisenseList = []
+        """Returns a set of contigs at the sense end and a set of those at the antisense end of their annotations"""
+        cached = self.cachedValue("contigends:"+self.table)
+        if cached:
+            self.senseContigIDs, self.antisenseContigIDs = cached
+            return
+        senseIDs = set()
+        antisenseIDs = set()
         annotationdict = {}
         MySQLcursorObj = self.FURdb.cursor()
         # Construct a dictionary of annotation strands and start positions
         MySQLcursorObj.execute("SELECT id, alignStart, strand FROM annotations")
         for (id, alignStart, strand) in MySQLcursorObj:
             annotationdict[id]=[int(alignStart),strand]
-        # Get the contig ids and positions and assign them to one of the two lists
+        # Get the contig ids and positions and assign them to one of the two sets
         MySQLcursorObj.execute("SELECT id, annotation, start FROM "+self.table)
         for (id, annotation, start) in MySQLcursorObj:
             if isSense(annotationdict.get(annotation)[0],annotationdict.get(annotation)[1],int(start)):
-                senseList = senseList+[id]
+                senseIDs.add(id)
             else:
-                antisenseList = antisenseList+[id]
-        self.senseContigIDs = senseList
-        self.antisenseContigIDs = antisenseList
+                antisenseIDs.add(id)
+        self.senseContigIDs = senseIDs
+        self.antisenseContigIDs = antisenseIDs
+        self.cacheValue("contigends:"+self.table, (senseIDs, antisenseIDs))
     ### Functions related to the exporting of sequence information.
     # Internal function used by exportSequenceAdv.
     # INPUT: File object, ContigList[id,sequence,sequence length], convert to complementary strand, largest contig only, fixed contig size
@@ -59,11 +65,13 @@ class analysis(libFURdatabase.furdbobj):
                     sequence = sequence[:fixed]  # Uses the first part of the sequence (after orientation so position relative to annotation is similar where possible)
                 # Write out to file
                 libFURshared.exportFASTAEntry(fileoutobj, str(item[0]), sequence)
+                libFURshared.recordProgress(1, len(sequence))
                 exportCount = exportCount+1
         return exportCount  # Return the number of sequences exported for reporting back to the user (via calling function)
     # Advanced export function, required to produce the files to align with.
     # INPUT: Orientation (5-3/Genome/Sense/Antisense), End (Both, Sense, Antisense), Largestonly (Single largest contig on/off), Fixed (Set exact size for exported contigs, 0=off)
     # TODO: Report number of annotations (/regions) exported to terminal prompt
+    @libFURshared.measureStage("exportSequencesAdv")
     def exportSequencesAdv(self, fileoutobj, orientation="G", end="B", equal=0, largestonly=0, fixed=0, closest=0):
         """Advanced export of the sequences within a table."""
         # Construct a list of annotations referenced in the table
@@ -78,8 +86,9 @@ class analysis(libFURdatabase.furdbobj):
             # Check which contigs are sense and antisense and get the information from the database
             senseContigs=[]
             antisenseContigs=[]
-            MySQLcursorObj.execute("SELECT id, sequence, start FROM "+self.table+" WHERE annotation="+str(item))
-            for (id, sequence, start) in MySQLcursorObj:
+            MySQLcursorObj.execute("SELECT id, sequence, start, end FROM "+self.table+" WHERE annotation="+str(item))
+            for (id, sequence, start, end) in MySQLcursorObj.fetchall():
+                sequence = self.contigSequence(sequence, item, start, end)
                 if id in self.senseContigIDs:
                     senseContigs=senseContigs+[[id,sequence,len(sequence), start]]
                 else:
@@ -240,22 +249,24 @@ class analysis(libFURdatabase.furdbobj):
         regionSenseSize = {}
         regionAntiSize = {}
         MySQLcursorObj = self.FURdb.cursor()
-        MySQLcursorObj.execute("SELECT id, annotation, sequence FROM "+self.table)
-        for (id, annotation, sequence) in MySQLcursorObj:
+        # Contig sizes are calculated from the positions (matches the sequence length) to avoid transferring the sequences
+        MySQLcursorObj.execute("SELECT id, annotation, start, end FROM "+self.table)
+        for (id, annotation, start, end) in MySQLcursorObj:
+            length = int(end)-int(start)
             if id in self.senseContigIDs:
                 if annotation in regionSenseSize:
-                    size = regionSenseSize.get(annotation)[0]+len(sequence)
+                    size = regionSenseSize.get(annotation)[0]+length
                     contigs = regionSenseSize.get(annotation)[1]+1
                     regionSenseSize[annotation] = [size,contigs]
                 else:
-                    regionSenseSize[annotation] = [len(sequence),1]
+                    regionSenseSize[annotation] = [length,1]
             else:
                 if annotation in regionAntiSize:
-                    size = regionAntiSize.get(annotation)[0]+len(sequence)
+                    size = regionAntiSize.get(annotation)[0]+length
                     contigs = regionAntiSize.get(annotation)[1]+1
                     regionAntiSize[annotation] = [size,contigs]
                 else:
-                    regionAntiSize[annotation] = [len(sequence),1]
+                    regionAntiSize[annotation] = [length,1]
         return regionSenseSize, regionAntiSize
     # Returns information on the flanking positions
     def getFlankingSize(self, flankingsize=5000):
@@ -279,6 +290,7 @@ class analysis(libFURdatabase.furdbobj):
 ### Class for the alignment file (SAM)
 class alignfile(object):
     """An object for alignment files, storing related functions and variables"""
+    @libFURshared.measureStage("alignfile")
     def __init__(self, analysisobj, fileobj, quality=40, incAll=0, type="SAM"):
         """Create the object"""
         self.analysisobj = analysisobj
@@ -337,6 +349,7 @@ class alignfile(object):
             line = self.fileobj.readline()
         self.contigAlignments = aligncount
         self.numTotalAlignments = totalAlignments
+        libFURshared.recordProgress(totalAlignments)
         # Run the contig alignments through the database to group by annotation
         sensealigns, antialigns = self.analysisobj.countAnnoAligns(self.contigAlignments)
         self.annoAlignmentsSense = sensealigns
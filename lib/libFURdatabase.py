@@ -1,16 +1,66 @@
 # libFURcreate
 # Functions required to create the FUR database
 
-from lib import libFURshared    # Reusing code from annotation utilities project (Annotation object)
+from lib import libFURshared    # Reusing code from annotation utilities project (annotation parsing)
+import array
+import bisect
+import collections
+import itertools
+import mmap
+import multiprocessing
 import os
+import re
+import shutil
+import signal
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # Constants
-schemaver = 0		# Database schema version (currently unused but added to detect changes expected in database layout)
+schemaver = 6		# Database schema version (used to detect changes expected in database layout, see database.upgradeSchema)
+sequenceformats = {"text":0, "packed":1}	# Sequence storage formats (packed uses the 2 bit format in libFURshared)
+contigstorageformats = {"sequence":0, "coordinates":1}	# Contig table storage (coordinates only stores positions, sequences are retrieved when needed)
+dedupmethods = {"self":1, "genome":2, "both":3}	# Deduplication methods, match the contigs against themselves; the genome or both
+stages = ["annotations", "flanking", "UnmaskedContigs", "DeduplicatedContigs"]	# Database build stages (the table populated by each), see database.recordCoverage
+seqtables = ["flanking", "UnmaskedContigs", "DeduplicatedContigs"]	# Tables containing sequences
+contigtables = ["UnmaskedContigs", "DeduplicatedContigs"]	# Tables containing contigs derived from the flanking regions
+statstables = ["annotations"]+seqtables	# Tables with row and base pair counts kept in the tablestats table (see database.tablesizes)
+batchdefault = 10000	# Number of rows written per transaction when bulk loading tables
+flankingtasksize = 1000	# Number of annotations (or flanking regions) processed per task when streaming or using multiple jobs
+lookupbatchsize = 500	# Number of rows retrieved per query when looking up rows by ID (below the SQLite limit of 999 parameters)
+poolsize = 5	# Number of connections kept in each SQL server connection pool (see connectionmanager)
+kmerdefault = 31	# Default k-mer size used by the k-mer deduplication engine
+kmertasksize = 2000000	# Size of the genome regions counted per task by the k-mer deduplication engine (the k-mer codes of a region are held at once)
+mapbucketsize = 4000000	# Approximate number of genome k-mers sorted at once when building a mappability track (roughly 50 bytes of memory per k-mer, per job)
+maptasksize = 2000000	# Size of the genome regions whose k-mers are sorted into buckets per task when building a mappability track
+mapheader = struct.Struct("<8sII")	# Mappability track file header (identifier, k-mer size, alternative chromosomes ignored)
+# SQLite connection profiles, settings applied when connecting to a local database file (ignored for SQL servers).
+# default: SQLite default settings.
+# bulk: For building a database. Uses write ahead logging with fewer disk syncs, a large cache and memory mapping.
+#       NOTE: A power failure or system crash during a build may lose recent changes, rerun the build if this occurs.
+# read: For analysis and inspection. Opens the database read only with a large cache and memory mapping.
+sqliteprofiles = {"default": [],
+                  "bulk": ["PRAGMA journal_mode=WAL", "PRAGMA synchronous=NORMAL", "PRAGMA cache_size=-262144", "PRAGMA temp_store=MEMORY", "PRAGMA mmap_size=1073741824"],
+                  "read": ["PRAGMA query_only=1", "PRAGMA cache_size=-262144", "PRAGMA temp_store=MEMORY", "PRAGMA mmap_size=1073741824"]}
+# Secondary indexes [name, table, column, foreign key] used by lookups on each table.
+# These are not created with the tables, instead they are built by createIndexes once a table has been populated (faster bulk loading).
+# NOTE: MySQL indexes foreign key columns when the table is created, so indexes on a foreign key are only built for SQLite.
+tableindexes = [["annotationsChrName", "annotations", "chrName", 0],
+                ["flankingAnnotation", "flanking", "annotation", 1],
+                ["UnmaskedContigsAnnotation", "UnmaskedContigs", "annotation", 1],
+                ["DeduplicatedContigsAnnotation", "DeduplicatedContigs", "annotation", 1]]
 
 # Create the SQL database table structure
-# INPUT: SQL login details (host, user, password) the name of the database to create and if an existing database should be replaced.
-def createDB(SQLusername, SQLpassword, SQLhostname="localhost", dbname="FURdb", overwrite=0):
+# INPUT: SQL login details (host, user, password) the name of the database to create, if an existing database should be replaced, the sequence storage format and contig storage format.
+# NOTE: The secondary indexes listed in tableindexes are built separately, after population, by database.createIndexes.
+def createDB(SQLusername, SQLpassword, SQLhostname="localhost", dbname="FURdb", overwrite=0, seqformat=0, contigstorage=0):
         """Creates the database and tables on the specified SQL server."""
+        # Close the shared connections to a database being replaced (see connectionmanager)
+        connections.closeDatabase(SQLhostname, dbname)
         # Connect to SQL server
         if SQLhostname != "":
             # If a hostname is provided connect to the SQL server
@@ -30,6 +80,7 @@ def createDB(SQLusername, SQLpassword, SQLhostname="localhost", dbname="FURdb",
             # SQL terminology differences:
             autoinc = "INT AUTO_INCREMENT"
             prikey = ",PRIMARY KEY (id)"
+            seqtype = "MEDIUMBLOB"
         else:
             # If no hostname is provided use a local SQLite database
             import sqlite3
@@ -43,6 +94,10 @@ def createDB(SQLusername, SQLpassword, SQLhostname="localhost", dbname="FURdb",
             # SQL terminology differences:
             autoinc = "INTEGER PRIMARY KEY AUTOINCREMENT"
             prikey = ""
+            seqtype = "BLOB"
+        # Packed sequences are stored as binary data
+        if seqformat == 0:
+            seqtype = "TEXT"
 		# Create TABLES
         MySQLcursorObj.execute("CREATE TABLE info ("
                     "tableid INT,"
@@ -50,6 +105,9 @@ def createDB(SQLusername, SQLpassword, SQLhostname="localhost", dbname="FURdb",
                     "flankingsize INT,"
                     "flankingoffset INT,"
                     "mincontigsize INT,"
+                    "sequenceformat INT,"
+                    "contigstorage INT,"
+                    "dedupmethod INT,"
                     "PRIMARY KEY (tableid))")
         MySQLcursorObj.execute("CREATE TABLE annotations ("
                     "id "+autoinc+","
@@ -66,7 +124,7 @@ def createDB(SQLusername, SQLpassword, SQLhostname="localhost", dbname="FURdb",
         MySQLcursorObj.execute("CREATE TABLE flanking ("
                     "id "+autoinc+","
                     "annotation INT NOT NULL,"
-                    "sequence TEXT,"
+                    "sequence "+seqtype+","
                     "start INT,"
                     "end INT"
                     ""+prikey+","
@@ -74,7 +132,7 @@ def createDB(SQLusername, SQLpassword, SQLhostname="localhost", dbname="FURdb",
         MySQLcursorObj.execute("CREATE TABLE UnmaskedContigs ("
                     "id "+autoinc+","
                     "annotation INT NOT NULL,"
-                    "sequence TEXT,"
+                    "sequence "+seqtype+","
                     "start INT,"
                     "end INT"
                     ""+prikey+","
@@ -82,237 +140,1163 @@ def createDB(SQLusername, SQLpassword, SQLhostname="localhost", dbname="FURdb",
         MySQLcursorObj.execute("CREATE TABLE DeduplicatedContigs ("
                     "id "+autoinc+","
                     "annotation INT NOT NULL,"
-                    "sequence TEXT,"
+                    "sequence "+seqtype+","
                     "start INT,"
                     "end INT"
                     ""+prikey+","
                     "FOREIGN KEY (annotation) REFERENCES annotations(id))")
+        # Range of annotation ids processed by each stage (allows annotations to be appended without rebuilding the database)
+        MySQLcursorObj.execute("CREATE TABLE coverage ("
+                    "stage VARCHAR(45) NOT NULL,"
+                    "firstid INT,"
+                    "lastid INT)")
+        # Progress of the stage being populated, committed with each batch of rows (allows an interrupted build to be resumed)
+        MySQLcursorObj.execute("CREATE TABLE checkpoints ("
+                    "stage VARCHAR(45) NOT NULL,"
+                    "chrName VARCHAR(45),"
+                    "lastid INT)")
+        # Number of rows and base pairs in each table, updated as rows are added (avoids reading every sequence to report the table sizes)
+        MySQLcursorObj.execute("CREATE TABLE tablestats ("
+                    "tablename VARCHAR(45) NOT NULL,"
+                    "rowcount BIGINT,"
+                    "basepairs BIGINT,"
+                    "PRIMARY KEY (tablename))")
         # Populate any essential details:
-        MySQLcursorObj.execute("INSERT INTO info VALUES (1, "+str(schemaver)+", 0, 0, 0)")
+        MySQLcursorObj.execute("INSERT INTO info VALUES (1, "+str(schemaver)+", 0, 0, 0, "+str(seqformat)+", "+str(contigstorage)+", 0)")
+        for table in statstables:
+            MySQLcursorObj.execute("INSERT INTO tablestats VALUES ('"+table+"', 0, 0)")
         FURdb.commit()
         FURdb.close()
 
+# Check if a database is present
+# INPUT: SQL login details (host, user, password) and the name of the database
+def databaseExists(SQLusername, SQLpassword, SQLhostname="localhost", dbname="FURdb"):
+        """Returns true if the database is present on the specified SQL server."""
+        if SQLhostname != "":
+            import mysql.connector
+            FURdb = mysql.connector.connect(
+                host=SQLhostname,
+                user=SQLusername,
+                password=SQLpassword
+                )
+            MySQLcursorObj = FURdb.cursor()
+            MySQLcursorObj.execute("SHOW DATABASES LIKE %s", (dbname,))
+            present = len(MySQLcursorObj.fetchall())>0
+            FURdb.close()
+            return present
+        return os.path.exists(dbname+".db")
+
+# Database connection manager
+# Shares connections, and the details read from each database, between objects using the same database so creating an object (ie. for each action in the user interface) does not reconnect and reread the database.
+# SQL server connections are taken from a connection pool and returned to the pool when the object is closed.
+# NOTE: SQLite connections can only be used by the thread which opened them, so one connection is kept open per thread and database file (see closeDatabase).
+class connectionmanager(object):
+    def __init__(self):
+        """Create the connection manager"""
+        self.pools = {}         # SQL server connection pools, by server, user, password and database
+        self.poolcount = 0      # Number of pools created (used to give each pool a unique name)
+        self.sqlitedbs = {}     # SQLite connections, by thread, database file and connection profile
+        self.metadata = {}      # Details shared by the objects using each database, by server, user and database
+        self.lock = threading.Lock()
+    # Returns a connection to the database and the dictionary of details shared by objects using the database
+    # INPUT: SQL login details (host, user, password), database name and the connection profile (see sqliteprofiles)
+    def connect(self, SQLuser, SQLpass, SQLhost, SQLdb, profile="default"):
+        """Returns a database connection and the shared database details"""
+        with self.lock:
+            metadata = self.metadata.setdefault((SQLhost, SQLuser, SQLdb), {})
+            if SQLhost != "":
+                # If a hostname is provided take a connection from the SQL server connection pool
+                import mysql.connector                      # Module not builtin (needs error checking)
+                import mysql.connector.pooling
+                poolkey = (SQLhost, SQLuser, SQLpass, SQLdb)
+                if poolkey not in self.pools:
+                    self.poolcount = self.poolcount+1
+                    self.pools[poolkey] = mysql.connector.pooling.MySQLConnectionPool(
+                        pool_name="FURdb"+str(self.poolcount),
+                        pool_size=poolsize,
+                        host=SQLhost,
+                        user=SQLuser,
+                        password=SQLpass,
+                        database = SQLdb
+                        )                                   # Fails with system halt
+                try:
+                    FURdb = self.pools[poolkey].get_connection()
+                except mysql.connector.errors.PoolError:
+                    # All of the pooled connections are in use, so open a separate connection (closed when released)
+                    FURdb = mysql.connector.connect(
+                        host=SQLhost,
+                        user=SQLuser,
+                        password=SQLpass,
+                        database = SQLdb
+                        )
+            else:
+                # If no hostname is provided reuse (or open) the thread's connection to the local SQLite database
+                import sqlite3
+                sqlitekey = (threading.get_ident(), os.path.abspath(SQLdb+".db"), profile)
+                FURdb = self.sqlitedbs.get(sqlitekey)
+                if not FURdb:
+                    if profile == "read":
+                        # Read only connections are opened as a URI, which also prevents a missing database file being created
+                        import urllib.request
+                        FURdb = sqlite3.connect("file:"+urllib.request.pathname2url(SQLdb+".db")+"?mode=ro", uri=True)
+                    else:
+                        FURdb = sqlite3.connect(SQLdb+".db")   # Fails silently (creates db file)
+                    for pragma in sqliteprofiles.get(profile):
+                        FURdb.execute(pragma)
+                    self.sqlitedbs[sqlitekey] = FURdb
+        return FURdb, metadata
+    # Releases a connection returned by connect once an object has finished with it.
+    # NOTE: SQL server connections are returned to the pool, SQLite connections stay open for reuse by the thread.
+    def release(self, FURdb, SQLhost):
+        """Releases a database connection"""
+        if SQLhost != "":
+            FURdb.close()
+    # Closes the connections to a database and forgets its details, used when a database is removed or replaced (see createDB).
+    # NOTE: Only the calling thread's SQLite connections can be closed, other threads' connections are forgotten.
+    def closeDatabase(self, SQLhost, SQLdb):
+        """Closes and forgets the connections and details of a database"""
+        with self.lock:
+            for key in [key for key in self.metadata if key[0] == SQLhost and key[2] == SQLdb]:
+                del self.metadata[key]
+            if SQLhost != "":
+                for key in [key for key in self.pools if key[0] == SQLhost and key[3] == SQLdb]:
+                    del self.pools[key]
+            else:
+                for key in [key for key in self.sqlitedbs if key[1] == os.path.abspath(SQLdb+".db")]:
+                    if key[0] == threading.get_ident():
+                        self.sqlitedbs[key].close()
+                    del self.sqlitedbs[key]
+
+# Connections shared by the database objects in this process
+connections = connectionmanager()
+
 # Shared database object functions
 # Inherited by classes requiring an SQL connection to the database
 class furdbobj(object):
     # Object creation tasks
-    def __init__(self, SQLuser, SQLpass, SQLhost="localhost", SQLdb="FURdb", verbosity=0):
+    # NOTE: The profile sets the SQLite connection settings (see sqliteprofiles) and has no effect on SQL server connections.
+    def __init__(self, SQLuser, SQLpass, SQLhost="localhost", SQLdb="FURdb", verbosity=0, profile="default"):
         """Create the object, set verbosity and connect it to the SQL database."""
         self.verbosity = verbosity
-        # Connect to SQL server
+        if profile not in sqliteprofiles:
+            raise ValueError("Unknown connection profile "+str(profile))
+        # Connect to the SQL server (or local SQLite database), sharing connections and database details with other objects (see connectionmanager)
+        self.FURdb, self.metadata = connections.connect(SQLuser, SQLpass, SQLhost, SQLdb, profile)
+        # SQL terminology differences:
         if SQLhost != "":
-            # If a hostname is provided connect to the SQL server
-            import mysql.connector                      # Module not builtin (needs error checking)
-            self.FURdb = mysql.connector.connect(
-                host=SQLhost,
-                user=SQLuser,
-                password=SQLpass,
-                database = SQLdb
-                )                                       # Fails with system halt
+            self.sqlparam = "%s"
         else:
-            # If no hostname is provided use a local SQLite database
-            import sqlite3
-            self.FURdb = sqlite3.connect(SQLdb+".db")   # Fails silently (creates db file)
-        # Check database schema.
-        MySQLcursorObj = self.FURdb.cursor()
-        MySQLcursorObj.execute("SELECT tableschema FROM info")
-        for (tableschema) in MySQLcursorObj:
-            dbschema = int(tableschema[0])
+            self.sqlparam = "?"
+        # Check database schema (read once and shared by objects using the same database).
+        if "dbschema" not in self.metadata:
+            self.readMetadata()
+        dbschema = self.metadata["dbschema"]
         if dbschema != schemaver and self.verbosity == 1:
-            print("Warning: Unexpected SQL database version.")
+            print("Warning: Unexpected SQL database version. (Databases created by older versions can be updated using FURsetup upgrade)")
+        self.dbschema = dbschema
+        # Sequence storage format (recorded from schema version 1) and contig storage format (recorded from schema version 2)
+        self.seqformat = self.metadata["seqformat"]
+        self.contigstorage = self.metadata["contigstorage"]
+        self.flankingcache = [None, []]     # Flanking regions of the last annotation used to retrieve a contig sequence
         # If successful store the hostname/username/password/database in the object for reuse (if needed)
         self.SQLuser = SQLuser
         self.SQLpass = SQLpass
         self.SQLhost = SQLhost
         self.SQLdb = SQLdb
+        self.profile = profile
+        self.FURdbStream = None
+    # Reads the schema version and storage formats of the database into the shared database details
+    def readMetadata(self):
+        """Reads the database schema version and storage formats"""
+        MySQLcursorObj = self.FURdb.cursor()
+        MySQLcursorObj.execute("SELECT tableschema FROM info")
+        for (tableschema) in MySQLcursorObj:
+            dbschema = int(tableschema[0])
+        seqformat = 0
+        contigstorage = 0
+        if dbschema >= 1:
+            MySQLcursorObj.execute("SELECT sequenceformat FROM info")
+            for (sequenceformat) in MySQLcursorObj:
+                seqformat = int(sequenceformat[0])
+        if dbschema >= 2:
+            MySQLcursorObj.execute("SELECT contigstorage FROM info")
+            for (contigstoragevalue) in MySQLcursorObj:
+                contigstorage = int(contigstoragevalue[0])
+        self.metadata.update({"dbschema": dbschema, "seqformat": seqformat, "contigstorage": contigstorage})
+    # Values calculated from the database contents (ie. the contig ends used by analysis) which are kept in the shared database details.
+    # NOTE: The values are cleared whenever a table is changed (see storeMetadata).
+    def cachedValue(self, name):
+        """Returns a cached value, or None if it is not cached"""
+        return self.metadata.setdefault("cache", {}).get(name)
+    def cacheValue(self, name, value):
+        """Stores a value in the cache shared with other objects using the database"""
+        self.metadata.setdefault("cache", {})[name] = value
+    # Stores changes to the schema version or storage formats in the shared database details and clears the cached values.
+    def storeMetadata(self):
+        """Updates the shared database details after the database has been changed"""
+        self.metadata.update({"dbschema": self.dbschema, "seqformat": self.seqformat, "contigstorage": self.contigstorage, "cache": {}})
 	# Closes the database connection:
     def close(self):
-        """Function to close the current database connection"""
-        self.FURdb.close()
+        """Function to close (or release) the current database connection"""
+        connections.release(self.FURdb, self.SQLhost)
+        if self.FURdbStream:
+            self.FURdbStream.close()
+    # Returns a cursor for reading through a large query while other queries are run (ie. looking up or inserting related rows).
+    # NOTE: SQL servers do not allow other queries on a connection until a streamed result has been read, so a second connection is used.
+    def streamCursor(self):
+        """Returns a cursor suitable for streaming the results of a large query"""
+        if self.SQLhost != "":
+            if not self.FURdbStream:
+                import mysql.connector
+                self.FURdbStream = mysql.connector.connect(
+                    host=self.SQLhost,
+                    user=self.SQLuser,
+                    password=self.SQLpass,
+                    database = self.SQLdb,
+                    autocommit=True
+                    )
+            return self.FURdbStream.cursor()
+        return self.FURdb.cursor()
+    # Convert sequences to and from the storage format used by the database
+    def encodeSequence(self, sequence):
+        """Converts a sequence into the format stored in the database"""
+        return encodeSequence(sequence, self.seqformat)
+    def decodeSequence(self, value):
+        """Converts a stored sequence back into a sequence string"""
+        return decodeSequence(value, self.seqformat)
+    def encodeContig(self, sequence):
+        """Converts a contig sequence into the value stored in the contig tables (nothing if only coordinates are stored)"""
+        return encodeContig(sequence, self.seqformat, self.contigstorage)
+    def sequenceLength(self, value):
+        """Returns the length of a stored sequence"""
+        if self.seqformat == 1:
+            return libFURshared.packedLength(value)
+        return len(value)
+    # Returns the sequence of a contig, retrieving it from the flanking regions when the contig tables only store coordinates.
+    # INPUT: Stored sequence value, annotation ID, start and end positions
+    def contigSequence(self, value, annotation, start, end):
+        """Returns the sequence of a contig"""
+        if value is not None:
+            return self.decodeSequence(value)
+        return self.materialiseSequence(annotation, start, end)
+    # Retrieve a region from the flanking region containing it.
+    # NOTE: The flanking regions of the last annotation are kept, as contigs are normally processed in annotation order.
+    def materialiseSequence(self, annotation, start, end):
+        """Returns the sequence for a region of an annotation's flanking region"""
+        if self.flankingcache[0] != annotation:
+            MySQLcursorObj = self.FURdb.cursor()
+            MySQLcursorObj.execute("SELECT sequence, start, end FROM flanking WHERE annotation="+str(annotation))
+            self.flankingcache = [annotation, MySQLcursorObj.fetchall()]
+        for (sequence, flankStart, flankEnd) in self.flankingcache[1]:
+            if flankStart <= start and flankEnd >= end and sequence is not None:
+                return self.decodeSequence(sequence)[start-flankStart:end-flankStart]
+        if self.verbosity:
+            print("WARNING: No sequence available for annotation "+str(annotation)+" region "+str(start)+":"+str(end))
+        return ""
+    # Writes a batch of rows to a table using a single parameterised statement.
+    # INPUT: Cursor object, table name, list of column names and a list of row value lists
+    # NOTE: The transaction is not committed, allowing the caller to decide when to commit.
+    # NOTE: The table statistics are updated in the same transaction (the length of each sequence row is its end-start).
+    def insertRows(self, MySQLcursorObj, table, columns, rows):
+        """Inserts a list of rows into a table using executemany"""
+        if rows:
+            placeholders = ", ".join([self.sqlparam]*len(columns))
+            MySQLcursorObj.executemany("INSERT INTO "+table+" ("+", ".join(columns)+") VALUES ("+placeholders+")", rows)
+            bp = 0
+            if columns[-2:] == ["start", "end"]:
+                bp = sum([row[-1]-row[-2] for row in rows])
+            if self.dbschema >= 5 and table in statstables:
+                MySQLcursorObj.execute("UPDATE tablestats SET rowcount=rowcount+"+str(len(rows))+", basepairs=basepairs+"+str(bp)+" WHERE tablename="+self.sqlparam, (table,))
+            # Count the rows (and bases) written in the stage being measured
+            libFURshared.recordProgress(len(rows), bp)
+            self.metadata["cache"] = {}
 
 
 # Database population class.
 class database(furdbobj):
     # Inherited object creation functions
-    def __init__(self, SQLuser, SQLpass, SQLhost="localhost", SQLdb="FURdb", verbosity=0):
+    def __init__(self, SQLuser, SQLpass, SQLhost="localhost", SQLdb="FURdb", verbosity=0, profile="default"):
         """Create the object, set verbosity and connect it to the SQL database."""
         # Inherit the shared functions from a shared parent class
-        super().__init__(SQLuser, SQLpass, SQLhost, SQLdb, verbosity)
+        super().__init__(SQLuser, SQLpass, SQLhost, SQLdb, verbosity, profile)
     # Add L1 annotions - any filtering should be done on the file prior to this point
     # NOTE: Different sources use different scoring methods.
-    def populateAnnotations(self, fileobj, filetype):
+    # NOTE: Annotations are added after any already present, returns the id of the first annotation added.
+    # NOTE: If resume is set the annotations already loaded from the file (see checkpoints) are skipped.
+    @libFURshared.measureStage("populateAnnotations")
+    def populateAnnotations(self, fileobj, filetype, batchsize=batchdefault, resume=0):
         """Populates the annotations table."""
         # Create cursor object
         MySQLcursorObj = self.FURdb.cursor()
-        # Store header (if applicable)
-        if filetype == "BED":
-            header = ""
-        else:
-            header = fileobj.readline()
-        # Loop through the annotation entries adding them to the SQL database
-        for line in fileobj.readlines():
-            # Process the entry and create a common object
-            entry = libFURshared.Annotation(line, filetype, header)
+        skipcount = self.loadCheckpoints("annotations", resume).get("", 0)
+        firstid = self.nextAnnotationId()-skipcount
+        columns = ["repName", "chrName", "alignStart", "alignEnd", "strand", "score", "matchStart", "matchEnd"]
+        # Loop through the annotation entries adding them to the SQL database in batches (one transaction per batch)
+        starttime = time.time()
+        rowcount = 0
+        batch = []
+        for entry in libFURshared.parseAnnotations(fileobj, filetype):
+            if skipcount > 0:
+                skipcount = skipcount-1
+                rowcount = rowcount+1
+                continue
             # If the annotation file lacks information on the position of the match leave those fields unpopulated (BED files)
             if entry.matchStart<0 and entry.matchEnd<0:
-                MySQLcursorObj.execute("INSERT INTO annotations (repName, chrName, alignStart, alignEnd, strand, score) VALUES ('"+entry.repName+"', '"+entry.chrName+"', "+str(entry.alignStart)+", "+str(entry.alignEnd)+", '"+entry.strand+"', "+str(entry.score)+")")
+                batch.append((entry.repName, entry.chrName, entry.alignStart, entry.alignEnd, entry.strand, entry.score, None, None))
             # Otherwise populate all fields
             else:
-                MySQLcursorObj.execute("INSERT INTO annotations (repName, chrName, alignStart, alignEnd, strand, score, matchStart, matchEnd) VALUES ('"+entry.repName+"', '"+entry.chrName+"', "+str(entry.alignStart)+", "+str(entry.alignEnd)+", '"+entry.strand+"', "+str(entry.score)+", "+str(entry.matchStart)+", "+str(entry.matchEnd)+")")
-        fileobj.close()
+                batch.append((entry.repName, entry.chrName, entry.alignStart, entry.alignEnd, entry.strand, entry.score, entry.matchStart, entry.matchEnd))
+            if len(batch)>=batchsize:
+                self.insertRows(MySQLcursorObj, "annotations", columns, batch)
+                rowcount = rowcount+len(batch)
+                self.saveCheckpoints(MySQLcursorObj, "annotations", {"": rowcount})
+                self.FURdb.commit()
+                batch = []
+        self.insertRows(MySQLcursorObj, "annotations", columns, batch)
+        rowcount = rowcount+len(batch)
+        self.saveCheckpoints(MySQLcursorObj, "annotations", {"": rowcount})
         self.FURdb.commit()
+        fileobj.close()
+        self.recordCoverage("annotations", firstid)
+        self.clearCheckpoints("annotations")
+        if self.verbosity:
+            print(reportRate(rowcount, "rows", starttime))
+        return firstid
 	# Create a new flanking region table (Depends on Annotation and Descriptor table)
 	# INPUT: Human genome fasta file.
 	# Note: Differences in numbering systems could cause an out by one error in the stored sequence.
-    def populateFlankingRegions(self, fileobj, size=5000, offset=0):
+	# NOTE: If firstid is set only the annotations from that id onwards are processed (ie. appended annotations).
+	# NOTE: If resume is set the annotations already processed on each chromosome (see checkpoints) are skipped.
+    @libFURshared.measureStage("populateFlankingRegions")
+    def populateFlankingRegions(self, fileobj, size=5000, offset=0, batchsize=batchdefault, jobs=1, firstid=0, resume=0):
         """Populates the flanking region table."""
+        MySQLcursorObj = self.FURdb.cursor()
+        columns = ["annotation", "sequence", "start", "end"]
+        starttime = time.time()
+        rowcount = 0
+        commitcount = 0
+        batch = []
+        # Write the flanking regions to the database in batches (one transaction per batch, including the last annotation processed on each chromosome)
+        checkpoints = self.loadCheckpoints("flanking", resume)
+        progress = {}
+        for chr, lastid, rows in self.processFlankingRegions(fileobj, size, offset, jobs, extractFlanksTask, (size, offset, self.seqformat), firstid, checkpoints):
+            batch.extend(rows)
+            progress[chr] = lastid
+            if len(batch)>=batchsize:
+                self.insertRows(MySQLcursorObj, "flanking", columns, batch)
+                self.saveCheckpoints(MySQLcursorObj, "flanking", progress)
+                self.FURdb.commit()
+                rowcount = rowcount+len(batch)
+                commitcount = commitcount+1
+                batch = []
+                progress = {}
+        self.insertRows(MySQLcursorObj, "flanking", columns, batch)
+        self.saveCheckpoints(MySQLcursorObj, "flanking", progress)
+        self.FURdb.commit()
+        rowcount = rowcount+len(batch)
+        commitcount = commitcount+1
+        self.recordCoverage("flanking", firstid)
+        self.clearCheckpoints("flanking")
         if self.verbosity:
-            print("- Indexing genome")
-        genomeIndex = indexFASTA(fileobj)
+            print(reportRate(rowcount, "flanking regions", starttime))
+            print("-- Committed in "+str(commitcount)+" transactions")
+    # Create the unmasked contigs table directly from the genome, without storing the flanking region sequences (Depends on Annotation table)
+    # INPUT: Human genome fasta file.
+    # NOTE: If flankcoordinates is set the flanking region positions are stored (without sequences), otherwise the flanking table is left empty.
+    # NOTE: If firstid is set only the annotations from that id onwards are processed (ie. appended annotations).
+    # NOTE: If resume is set the annotations already processed on each chromosome (see checkpoints) are skipped.
+    @libFURshared.measureStage("populateContigsDirect")
+    def populateContigsDirect(self, fileobj, size=5000, offset=0, minsize=20, batchsize=batchdefault, jobs=1, flankcoordinates=0, firstid=0, resume=0):
+        """Populates the unmasked contigs table directly from the flanking regions in the genome."""
+        # Contigs stored as coordinates are retrieved from the flanking region sequences, which are not stored in this mode
+        if self.contigstorage == 1:
+            raise ValueError("Contigs stored as coordinates require the flanking region sequences, use contig storage format sequence.")
+        MySQLcursorObj = self.FURdb.cursor()
+        MySQLcursorObj.execute("UPDATE info SET mincontigsize="+str(minsize)+" WHERE tableid=1")
+        self.FURdb.commit()
+        columns = ["annotation", "sequence", "start", "end"]
+        starttime = time.time()
+        basecount = 0
+        flankingbatch = []
+        contigbatch = []
+        # Write the flanking region positions and contigs to the database in batches (one transaction per batch)
+        taskargs = (size, offset, minsize, self.seqformat, self.contigstorage, flankcoordinates, self.verbosity)
+        checkpoints = self.loadCheckpoints("UnmaskedContigs", resume)
+        progress = {}
+        for chr, lastid, (flankingrows, contigrows, bases) in self.processFlankingRegions(fileobj, size, offset, jobs, extractContigsTask, taskargs, firstid, checkpoints):
+            flankingbatch.extend(flankingrows)
+            contigbatch.extend(contigrows)
+            basecount = basecount+bases
+            progress[chr] = lastid
+            if len(contigbatch)>=batchsize or len(flankingbatch)>=batchsize:
+                self.insertRows(MySQLcursorObj, "flanking", columns, flankingbatch)
+                self.insertRows(MySQLcursorObj, "UnmaskedContigs", columns, contigbatch)
+                self.saveCheckpoints(MySQLcursorObj, "UnmaskedContigs", progress)
+                self.FURdb.commit()
+                flankingbatch = []
+                contigbatch = []
+                progress = {}
+                if self.verbosity:
+                    print(reportRate(basecount, "bp", starttime))
+        self.insertRows(MySQLcursorObj, "flanking", columns, flankingbatch)
+        self.insertRows(MySQLcursorObj, "UnmaskedContigs", columns, contigbatch)
+        self.saveCheckpoints(MySQLcursorObj, "UnmaskedContigs", progress)
+        self.FURdb.commit()
+        if flankcoordinates:
+            self.recordCoverage("flanking", firstid)
+        self.recordCoverage("UnmaskedContigs", firstid)
+        self.clearCheckpoints("UnmaskedContigs")
+        if self.verbosity:
+            print(reportRate(basecount, "bp", starttime))
+    # Processes the flanking regions of every annotation, chromosome by chromosome, returning the results of each task in order.
+    # INPUT: Genome file, flanking region size and offset, number of jobs, task function, any further arguments for the task function, the first annotation id to process and the last annotation id already processed on each chromosome
+    # OUTPUT: Chromosome, last annotation id and result for each task
+    # NOTE: Task functions are called with the genome, chromosome and a list of annotations (id, alignStart, alignEnd), followed by taskargs.
+    def processFlankingRegions(self, fileobj, size, offset, jobs, taskfunction, taskargs, firstid=0, checkpoints={}):
+        """Yields the result of a task function for each group of annotations"""
+        genome = genomeobj(fileobj, self.verbosity)
         # Access the database and store the flanking region size variable
         MySQLcursorObj = self.FURdb.cursor()
         MySQLcursorObj.execute("UPDATE info SET flankingsize="+str(size)+", flankingoffset="+str(offset)+" WHERE tableid=1")
         self.FURdb.commit()
         # Retrieve a list of chromosomes with annotations to process in chromosome order (faster)
         chrPresent = []
-        MySQLcursorObj.execute("SELECT DISTINCT chrName FROM annotations")
+        MySQLcursorObj.execute("SELECT DISTINCT chrName FROM annotations WHERE id>="+str(firstid))
         for (chrName) in MySQLcursorObj:
             chrPresent.append(chrName[0])
-        # For each chromosome:
-        for chr in chrPresent:
-            if self.verbosity:
-                print("Processing chromosome: "+chr)
-            chrSequence = loadChr(fileobj, chr, genomeIndex)
-            if chrSequence=="":
+        # If more than one job is requested process the tasks in worker processes, each with its own view of the genome.
+        # NOTE: Results are returned in task order, so the tables are identical to those produced by a single process.
+        pool = None
+        if jobs > 1:
+            pool = multiprocessing.Pool(jobs, initFlankingWorker, (genome.filename, genome.getIndex()))
+        try:
+            # For each chromosome:
+            for chr in chrPresent:
                 if self.verbosity:
-                    print("WARNING: No sequence available for chromosome "+chr+". Skipping annotation "+str(id))
-            else:
-                MySQLcurosorStore=[]
-                MySQLcursorObj.execute("SELECT id, alignStart, alignEnd, strand FROM annotations WHERE chrName='"+chr+"'")
-                for (id, alignStart, alignEnd, strand) in MySQLcursorObj:
-                    # Store the values
-                    MySQLcurosorStore=MySQLcurosorStore+[[id, alignStart, alignEnd, strand]]
-                for id, alignStart, alignEnd, strand in MySQLcurosorStore:
-                    # Retrieve following genomic region
-                    startpos = int(alignEnd)+offset
-                    endpos = startpos+size
-                    seq = chrSequence[startpos:endpos]
-                    # Check if the sequence is the expected length and correct if needed
-                    if len(seq)!=size:
-                        endpos = int(alignEnd)+len(seq)
-                    # Store in database
-                    if seq!="":
-                        MySQLcursorObj.execute("INSERT INTO flanking (annotation, sequence, start, end) VALUES ("+str(id)+",'"+seq+"', "+str(startpos)+", "+str(endpos)+")")
-                        self.FURdb.commit()
-                    # Retrieve preceeding genomic region
-                    endpos = int(alignStart)-offset
-                    startpos = endpos-size
-                    seq = chrSequence[startpos:endpos]
-                    # Check if the sequence is the expected length and correct if needed
-                    if len(seq)!=size:
-                        startpos = int(alignStart)-len(seq)
-                    # Store in database
-                    if seq!="":
-                        MySQLcursorObj.execute("INSERT INTO flanking (annotation, sequence, start, end) VALUES ("+str(id)+",'"+seq+"', "+str(startpos)+", "+str(endpos)+")")
-                        self.FURdb.commit()
+                    print("Processing chromosome: "+chr)
+                if not genome.hasChromosome(chr):
+                    if self.verbosity:
+                        print("WARNING: No sequence available for chromosome "+chr+". Skipping annotations on this chromosome.")
+                    continue
+                # Stream the chromosome's annotations, splitting them into tasks (allowing large chromosomes to be shared between the workers)
+                streamCursorObj = self.streamCursor()
+                streamCursorObj.execute("SELECT id, alignStart, alignEnd FROM annotations WHERE chrName="+self.sqlparam+" AND id>="+str(firstid)+" AND id>"+str(checkpoints.get(chr, 0))+" ORDER BY id", (chr,))
+                annotationList = streamCursorObj.fetchmany(flankingtasksize)
+                while annotationList:
+                    # Collect a group of tasks (two per job) to process at a time
+                    tasks = []
+                    while annotationList and len(tasks) < jobs*2:
+                        tasks.append((taskfunction, chr, annotationList)+tuple(taskargs))
+                        annotationList = streamCursorObj.fetchmany(flankingtasksize)
+                    if pool:
+                        results = pool.imap(flankingWorker, tasks)
+                    else:
+                        results = (task[0](genome, *task[1:]) for task in tasks)
+                    for task, result in zip(tasks, results):
+                        yield chr, task[2][-1][0], result
+                streamCursorObj.close()
+        except BaseException:
+            # Stop the workers immediately if processing fails or is interrupted (joining would wait for abandoned tasks)
+            if pool:
+                pool.terminate()
+            raise
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+            genome.close()
     # Create a table of unmasked contigs, preidentified in a softmapped genomic sequence (ie. Rep. Masked hg38)
-    def populateUnmaskedContigs(self, minsize = 20):
+    # NOTE: If firstid is set only the flanking regions of the annotations from that id onwards are processed (ie. appended annotations).
+    # NOTE: If resume is set the flanking regions already processed (see checkpoints) are skipped.
+    @libFURshared.measureStage("populateUnmaskedContigs")
+    def populateUnmaskedContigs(self, minsize = 20, batchsize=batchdefault, jobs=1, firstid=0, resume=0):
         """Populate the unmasked table, by removing known repeat sequences already identified in the genome."""
         # Access the database and store the minimum contig length used.
         MySQLcursorObj = self.FURdb.cursor()
         MySQLcursorObj.execute("UPDATE info SET mincontigsize="+str(minsize)+" WHERE tableid=1")
         self.FURdb.commit()
-        # Loop through the flanking table processing each entry
-        MySQLcurosorStore=[]
-        MySQLcursorObj.execute("SELECT annotation, sequence, start, end FROM flanking")
-        for (annotation, sequence, start, end) in MySQLcursorObj:
-            MySQLcurosorStore=MySQLcurosorStore+[[annotation, sequence, start, end]]
-        for annotation, sequence, start, end in MySQLcurosorStore:
-            if sequence != "":
-                unmaskedseqs = findUnmaskedSeq(sequence, minsize)
-                for entry in unmaskedseqs:
-                    startpos = entry[0]
-                    endpos = entry[1]
-                    if self.verbosity>1:
-                        print("Adding to annotation "+str(annotation)+" contig "+str(startpos)+":"+str(endpos))
-                    MySQLcursorObj.execute("INSERT INTO UnmaskedContigs (annotation, sequence, start, end) VALUES ("+str(annotation)+", '"+sequence[startpos:endpos]+"',"+str(startpos+start)+", "+str(endpos+start)+")")
-                    self.FURdb.commit()
+        # If more than one job is requested split the flanking regions into contigs in worker processes.
+        # NOTE: Tasks are consecutive runs of flanking regions (by id) and results are returned in task order, so contig ids match a single process build.
+        pool = None
+        if jobs > 1:
+            pool = multiprocessing.Pool(jobs, ignoreInterrupts)
+        # Stream through the flanking table processing each entry, writing the contigs in batches (one transaction per batch)
+        columns = ["annotation", "sequence", "start", "end"]
+        starttime = time.time()
+        basecount = 0
+        batch = []
+        # The last flanking region processed is committed with each batch
+        lastflankid = self.loadCheckpoints("UnmaskedContigs", resume).get("", 0)
+        try:
+            streamCursorObj = self.streamCursor()
+            streamCursorObj.execute("SELECT id, annotation, sequence, start, end FROM flanking WHERE annotation>="+str(firstid)+" AND id>"+str(lastflankid)+" ORDER BY id")
+            flankingrows = streamCursorObj.fetchmany(flankingtasksize)
+            while flankingrows:
+                # Collect a group of tasks (two per job) to process at a time
+                tasks = []
+                tasklastids = []
+                while flankingrows and len(tasks) < jobs*2:
+                    tasks.append(([row[1:] for row in flankingrows], minsize, self.seqformat, self.contigstorage, self.verbosity))
+                    tasklastids.append(flankingrows[-1][0])
+                    flankingrows = streamCursorObj.fetchmany(flankingtasksize)
+                if pool:
+                    results = pool.imap(contigWorker, tasks)
+                else:
+                    results = (extractContigs(*task) for task in tasks)
+                for lastflankid, (rows, bases) in zip(tasklastids, results):
+                    batch.extend(rows)
+                    basecount = basecount+bases
+                    if len(batch)>=batchsize:
+                        self.insertRows(MySQLcursorObj, "UnmaskedContigs", columns, batch)
+                        self.saveCheckpoints(MySQLcursorObj, "UnmaskedContigs", {"": lastflankid})
+                        self.FURdb.commit()
+                        batch = []
+                        if self.verbosity:
+                            print(reportRate(basecount, "bp", starttime))
+            streamCursorObj.close()
+            self.insertRows(MySQLcursorObj, "UnmaskedContigs", columns, batch)
+            self.saveCheckpoints(MySQLcursorObj, "UnmaskedContigs", {"": lastflankid})
+            self.FURdb.commit()
+            self.recordCoverage("UnmaskedContigs", firstid)
+            self.clearCheckpoints("UnmaskedContigs")
+        except BaseException:
+            # Stop the workers immediately if processing fails or is interrupted (joining would wait for abandoned tasks)
+            if pool:
+                pool.terminate()
+            raise
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+        if self.verbosity:
+            print(reportRate(basecount, "bp", starttime))
     # Simple export function, required for exporting to BLAT for further deduplication
-    def exportStoredSequences(self, fileoutobj, table="UnmaskedContigs"):
+    # NOTE: If a list of shard files is provided the sequences are also distributed between them (ie. for running BLAT in parallel).
+    # NOTE: If firstid is set only the sequences of the annotations from that id onwards are exported.
+    @libFURshared.measureStage("exportStoredSequences")
+    def exportStoredSequences(self, fileoutobj, table="UnmaskedContigs", shardfileobjs=None, firstid=0):
         """Simple export of all sequences in a table, without modification."""
-        MySQLcursorObj = self.FURdb.cursor()
-        MySQLcursorObj.execute("SELECT id, sequence FROM "+table)
-        for (id, sequence) in MySQLcursorObj:
+        MySQLcursorObj = self.streamCursor()
+        if firstid:
+            MySQLcursorObj.execute("SELECT id, sequence, annotation, start, end FROM "+table+" WHERE annotation>="+str(firstid)+" ORDER BY id")
+        else:
+            MySQLcursorObj.execute("SELECT id, sequence, annotation, start, end FROM "+table)
+        counter = 0
+        for (id, sequence, annotation, start, end) in MySQLcursorObj:
             name = str(id)
-            libFURshared.exportFASTAEntry(fileoutobj, name, sequence)
-    def populateDeduplicatedContigs(self, fileobj, minsize = 20, ignorealt=0, expdup=1):
+            sequence = self.contigSequence(sequence, annotation, start, end)
+            if fileoutobj:
+                libFURshared.exportFASTAEntry(fileoutobj, name, sequence)
+            if shardfileobjs:
+                libFURshared.exportFASTAEntry(shardfileobjs[counter%len(shardfileobjs)], name, sequence)
+            libFURshared.recordProgress(1, len(sequence))
+            counter = counter+1
+    # Identifies duplicated contigs using BLAT and populates the deduplicated contigs table.
+    # The unmasked contigs are split into shards, matched by concurrent BLAT processes and the results of each read in turn (without combining the files).
+    # INPUT: BLAT executable, deduplication method (see dedupmethods), genome filename (required for the genome methods), minimum contig size, ignore alternative chromosomes, the number of BLAT processes, rows per transaction and the first annotation id to process
+    # NOTE: Working files are kept in a temporary directory, which is removed once finished.
+    @libFURshared.measureStage("deduplicateBLAT")
+    def deduplicateBLAT(self, blat="blat", method=1, genomefilename=None, minsize=20, ignorealt=0, jobs=1, batchsize=batchdefault, firstid=0):
+        """Runs BLAT on the unmasked contigs and populates the DeduplicatedContigs table from the matches found."""
+        if method not in dedupmethods.values():
+            raise ValueError("Unknown deduplication method: "+str(method))
+        if method != 1 and not genomefilename:
+            raise ValueError("Genome file required for deduplication against the genome.")
+        # Use one shard per BLAT process (but no more shards than contigs)
+        MySQLcursorObj = self.FURdb.cursor()
+        MySQLcursorObj.execute("SELECT COUNT(*) FROM UnmaskedContigs WHERE annotation>="+str(firstid))
+        contigcount = MySQLcursorObj.fetchall()[0][0]
+        shards = max(1, min(jobs, contigcount))
+        workdir = tempfile.mkdtemp(prefix="FURdedup")
+        try:
+            # Export the contigs split into shards (and in full, if matching the contigs against themselves)
+            contigfilename = os.path.join(workdir, "UnmaskedContigs.fasta")
+            shardfilenames = [os.path.join(workdir, "UnmaskedContigs."+str(i)+".fasta") for i in range(shards)]
+            shardfileobjs = [open(filename, 'w') for filename in shardfilenames]
+            contigfileobj = None
+            if method in [1, 3]:
+                contigfileobj = open(contigfilename, 'w')
+            self.exportStoredSequences(contigfileobj, "UnmaskedContigs", shardfileobjs, firstid)
+            for fileobj in shardfileobjs+[contigfileobj]:
+                if fileobj:
+                    fileobj.close()
+            # Match each shard against each target (contigs and/or genome)
+            targets = []
+            if method in [1, 3]:
+                targets.append(contigfilename)
+            if method in [2, 3]:
+                targets.append(genomefilename)
+            commands = []
+            pslfilenames = []
+            for targetnum, target in enumerate(targets):
+                for shardnum, shardfilename in enumerate(shardfilenames):
+                    pslfilename = os.path.join(workdir, "blatmatches."+str(targetnum)+"."+str(shardnum)+".psl")
+                    commands.append([blat, target, shardfilename, pslfilename])
+                    pslfilenames.append(pslfilename)
+            if self.verbosity:
+                print("- Running "+str(len(commands))+" BLAT processes, "+str(jobs)+" at a time")
+            starttime = time.time()
+            for command, returncode in zip(commands, runCommands(commands, jobs, self.verbosity)):
+                if returncode != 0:
+                    raise RuntimeError("BLAT failed (exit code "+str(returncode)+"): "+" ".join(command))
+            if self.verbosity:
+                print("-- BLAT finished in "+"{:.1f}".format(time.time()-starttime)+"s")
+            # Each contig is expected to match itself once per target
+            pslfileobjs = [open(filename, 'r') for filename in pslfilenames]
+            self.populateDeduplicatedContigs(pslfileobjs, minsize, ignorealt, len(targets), batchsize, firstid, method)
+            for fileobj in pslfileobjs:
+                fileobj.close()
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    # Identifies duplicated regions of the unmasked contigs from their k-mers and populates the deduplicated contigs table (an alternative to BLAT).
+    # Counts each contig k-mer (and its reverse complement) within the contigs (self), the genome or both. Contig regions covered by k-mers found once are kept.
+    # INPUT: Deduplication method (see dedupmethods), genome filename (required for the genome methods), minimum contig size, ignore alternative chromosomes, the number of processes used to count the k-mers, k-mer size (up to 31), rows per transaction and the first annotation id to process
+    # NOTE: Only the k-mers present in the contigs are stored (see kmercountobj), but this requires memory proportional to the total length of the contigs.
+    @libFURshared.measureStage("deduplicateKmers")
+    def deduplicateKmers(self, method=1, genomefilename=None, minsize=20, ignorealt=0, jobs=1, k=kmerdefault, batchsize=batchdefault, firstid=0):
+        """Populates the DeduplicatedContigs table with the regions of the unmasked contigs made up of unique k-mers."""
+        if method not in dedupmethods.values():
+            raise ValueError("Unknown deduplication method: "+str(method))
+        if method != 1 and not genomefilename:
+            raise ValueError("Genome file required for deduplication against the genome.")
+        if k > 31:
+            raise ValueError("The k-mer deduplication engine supports k-mers of up to 31 bases.")
+        starttime = time.time()
+        selfcount = method in [1, 3]
+        # Collect the contig k-mers and count them, sorted into one shard per job (sorting and counting the shards in worker processes if more than one job is requested)
+        shards = max(1, jobs)
+        pool = None
+        if jobs > 1:
+            pool = multiprocessing.Pool(jobs, ignoreInterrupts)
+        try:
+            shardcodes = [array.array('q') for i in range(shards)]
+            streamCursorObj = self.streamCursor()
+            streamCursorObj.execute("SELECT id, sequence, annotation, start, end FROM UnmaskedContigs WHERE annotation>="+str(firstid)+" ORDER BY id")
+            contigList = streamCursorObj.fetchmany(flankingtasksize)
+            while contigList:
+                # Collect a group of tasks (two per job) to process at a time
+                tasks = []
+                while contigList and len(tasks) < jobs*2:
+                    tasks.append(([self.contigSequence(sequence, annotation, start, end) for (id, sequence, annotation, start, end) in contigList], k, shards))
+                    contigList = streamCursorObj.fetchmany(flankingtasksize)
+                if pool:
+                    results = pool.imap(shardKmersWorker, tasks)
+                else:
+                    results = (shardKmers(*task) for task in tasks)
+                for shardlist in results:
+                    for codes, kmers in zip(shardcodes, shardlist):
+                        codes.extend(kmers)
+            streamCursorObj.close()
+            if pool:
+                results = pool.imap(countShardKmers, shardcodes)
+            else:
+                results = (countShardKmers(codes) for codes in shardcodes)
+            kmerCounts = kmercountobj(list(results), k)
+            shardcodes = None
+        except BaseException:
+            # Stop the workers immediately if counting fails or is interrupted (joining would wait for abandoned tasks)
+            if pool:
+                pool.terminate()
+            raise
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+        if self.verbosity:
+            print("-- Found "+str(len(kmerCounts))+" distinct "+str(k)+"-mers in the unmasked contigs ("+"{:.1f}".format(time.time()-starttime)+"s)")
+        if method in [2, 3]:
+            # Count the contig k-mers in the genome, one chromosome region per task (in parallel if more than one job is requested)
+            genome = genomeobj(genomefilename, self.verbosity)
+            tasks = []
+            for chr in genome.chrOrder:
+                if not genome.hasChromosome(chr) or (ignorealt and chr[-4:]=="_alt"):
+                    continue
+                for regionStart in range(0, genome.chrLength(chr), kmertasksize):
+                    tasks.append((chr, regionStart, regionStart+kmertasksize, k))
+            genomeCounts = bytearray(len(kmerCounts))
+            if jobs > 1:
+                pool = multiprocessing.Pool(jobs, initKmerWorker, (genome.filename, genome.getIndex(), kmerCounts))
+                try:
+                    for counts in pool.imap_unordered(kmerWorker, tasks):
+                        for position, count in counts.items():
+                            genomeCounts[position] = min(genomeCounts[position]+count, 2)
+                except BaseException:
+                    # Stop the workers immediately if counting fails or is interrupted (joining would wait for abandoned tasks)
+                    pool.terminate()
+                    raise
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                for task in tasks:
+                    for position, count in countKmers(genome, kmerCounts, *task).items():
+                        genomeCounts[position] = min(genomeCounts[position]+count, 2)
+            genome.close()
+            # Combine the counts, a k-mer is unique if found once in each source used
+            if selfcount:
+                kmerCounts.counts = bytearray(genomecount if count == 1 else count for count, genomecount in zip(kmerCounts.counts, genomeCounts))
+            else:
+                kmerCounts.counts = genomeCounts
+            if self.verbosity:
+                print("-- Counted k-mers in "+str(len(tasks))+" genome regions ("+"{:.1f}".format(time.time()-starttime)+"s)")
+        # Keep the contig regions covered by unique k-mers, writing the results in batches (one transaction per batch)
+        MySQLcursorObj = self.FURdb.cursor()
+        columns = ["annotation", "sequence", "start", "end"]
+        batch = []
+        streamCursorObj = self.streamCursor()
+        streamCursorObj.execute("SELECT id, sequence, annotation, start, end FROM UnmaskedContigs WHERE annotation>="+str(firstid)+" ORDER BY id")
+        for (id, sequence, annotation, start, end) in streamCursorObj:
+            sequence = self.contigSequence(sequence, annotation, start, end)
+            uniquePositions = [position for runstart, kmers in canonicalKmerRuns(sequence, k) for position, count in enumerate(kmerCounts.countAll(kmers), runstart) if count==1]
+            for startpos, endpos in findKmerIntervals(uniquePositions, k, minsize):
+                if self.verbosity>1:
+                    print("Adding to annotation "+str(annotation)+" contig "+str(startpos)+":"+str(endpos))
+                batch.append((annotation, self.encodeContig(sequence[startpos:endpos]), startpos+start, endpos+start))
+            if len(batch)>=batchsize:
+                self.insertRows(MySQLcursorObj, "DeduplicatedContigs", columns, batch)
+                self.FURdb.commit()
+                batch = []
+        streamCursorObj.close()
+        self.insertRows(MySQLcursorObj, "DeduplicatedContigs", columns, batch)
+        self.FURdb.commit()
+        self.recordCoverage("DeduplicatedContigs", firstid)
+        self.recordDedupMethod(method)
+        if self.verbosity:
+            print("-- Deduplication finished in "+"{:.1f}".format(time.time()-starttime)+"s")
+    # Populates the deduplicated contigs table using a genome mappability track (built on first use and stored alongside the genome).
+    # Contig regions covered by k-mers found once in the genome are kept, matching the k-mer engine's genome method but without counting the genome each time.
+    # INPUT: Genome filename, minimum contig size, ignore alternative chromosomes, the number of processes used to build the track, k-mer size, rows per transaction and the first annotation id to process
+    @libFURshared.measureStage("deduplicateTrack")
+    def deduplicateTrack(self, genomefilename, minsize=20, ignorealt=0, jobs=1, k=kmerdefault, batchsize=batchdefault, firstid=0):
+        """Populates the DeduplicatedContigs table with the regions of the unmasked contigs which are unique in the genome."""
+        starttime = time.time()
+        track = mappabilityobj(genomefilename, k, ignorealt, jobs, self.verbosity)
+        # Check the genomic position of each contig, writing the results in batches (one transaction per batch)
+        MySQLcursorObj = self.FURdb.cursor()
+        columns = ["annotation", "sequence", "start", "end"]
+        batch = []
+        streamCursorObj = self.streamCursor()
+        streamCursorObj.execute("SELECT UnmaskedContigs.sequence, UnmaskedContigs.annotation, UnmaskedContigs.start, UnmaskedContigs.end, annotations.chrName FROM UnmaskedContigs JOIN annotations ON UnmaskedContigs.annotation=annotations.id WHERE UnmaskedContigs.annotation>="+str(firstid)+" ORDER BY UnmaskedContigs.id")
+        for (sequence, annotation, start, end, chrName) in streamCursorObj:
+            uniqueRegions = track.findUniqueRegions(chrName, start, end, minsize)
+            # Only the positions are needed when storing contigs as coordinates
+            if uniqueRegions and self.contigstorage == 0:
+                sequence = self.contigSequence(sequence, annotation, start, end)
+            for startpos, endpos in uniqueRegions:
+                if self.verbosity>1:
+                    print("Adding to annotation "+str(annotation)+" contig "+str(startpos)+":"+str(endpos))
+                if self.contigstorage == 0:
+                    batch.append((annotation, self.encodeContig(sequence[startpos:endpos]), startpos+start, endpos+start))
+                else:
+                    batch.append((annotation, None, startpos+start, endpos+start))
+            if len(batch)>=batchsize:
+                self.insertRows(MySQLcursorObj, "DeduplicatedContigs", columns, batch)
+                self.FURdb.commit()
+                batch = []
+        streamCursorObj.close()
+        self.insertRows(MySQLcursorObj, "DeduplicatedContigs", columns, batch)
+        self.FURdb.commit()
+        track.close()
+        self.recordCoverage("DeduplicatedContigs", firstid)
+        self.recordDedupMethod(dedupmethods.get("genome"))
+        if self.verbosity:
+            print("-- Deduplication finished in "+"{:.1f}".format(time.time()-starttime)+"s")
+    # NOTE: Accepts a PSL file object or a list of PSL file objects (ie. the results of BLAT run on separate shards).
+    # NOTE: If firstid is set only the contigs of the annotations from that id onwards are added.
+    # NOTE: The deduplication method (see dedupmethods) is recorded if known, ie. when BLAT is run by deduplicateBLAT.
+    @libFURshared.measureStage("populateDeduplicatedContigs")
+    def populateDeduplicatedContigs(self, fileobj, minsize = 20, ignorealt=0, expdup=1, batchsize=batchdefault, firstid=0, method=0):
         """Adds those sequences without duplications to the DeduplicatedContigs table."""
         MySQLcursorObj = self.FURdb.cursor()
         MySQLcursorObj2 = self.FURdb.cursor()
         # Create deduplication file object and process the file.
         dedupobj = dedupFile(fileobj)
         contigInfo = dedupobj.processFile(minsize, ignorealt)
-        # Check the results from processing the file
-        for contig in contigInfo:
-            matches = contigInfo.get(contig)
-            NumLargeMatches = matches[0]
-            MatchPostions = matches[1]
-            if NumLargeMatches==expdup and len(MatchPostions)==0:
-                # Sequence found only itself. Therefore add to database.
-                MySQLcursorObj.execute("SELECT annotation, sequence, start, end FROM UnmaskedContigs WHERE id="+str(contig))
-                for (annotation, sequence, start, end) in MySQLcursorObj:
-                    MySQLcursorObj2.execute("INSERT INTO DeduplicatedContigs (annotation, sequence, start, end) VALUES ("+str(annotation)+", '"+sequence+"',"+str(start)+", "+str(end)+")")
-                    self.FURdb.commit()
-            elif NumLargeMatches>expdup:
+        # Only contigs not duplicated more than expected need to be retrieved (in contig order, so the results do not depend on the order of the matches)
+        contigList = []
+        for contig in sorted(contigInfo):
+            if contigInfo.get(contig)[0]>expdup:
                 # The majority of the sequence was found more than once. Therefore ignore.
                 if self.verbosity>1:
                     print("Contig "+str(contig)+" duplicated more than expected. Ignoring.")
             else:
-                # Parts of the seqence were duplicated. Needs further checking.
-                # Load the sequence
-                MySQLcursorObj.execute("SELECT annotation, sequence, start, end FROM UnmaskedContigs WHERE id="+str(contig))
-                for (annotation, sequence, start, end) in MySQLcursorObj:
-                    MaskedSequence = sequence
-                    while len(MatchPostions)>0:
-                        duplicate = MatchPostions.pop()
-                        MaskedSequence = MaskedSequence[:duplicate[0]]+MaskedSequence[duplicate[0]:duplicate[1]].lower()+MaskedSequence[duplicate[1]:]
-                    # Check the masked sequence for unmasked regions of sufficient length
-                    unmaskedseqs = findUnmaskedSeq(MaskedSequence, minsize)
+                contigList.append(contig)
+        # Retrieve the contigs in groups (one query per group) and write the results in batches (one transaction per batch)
+        columns = ["annotation", "sequence", "start", "end"]
+        batch = []
+        for i in range(0, len(contigList), lookupbatchsize):
+            contigGroup = contigList[i:i+lookupbatchsize]
+            MySQLcursorObj.execute("SELECT id, annotation, sequence, start, end FROM UnmaskedContigs WHERE annotation>="+str(firstid)+" AND id IN ("+", ".join([self.sqlparam]*len(contigGroup))+")", contigGroup)
+            contigRows = {}
+            for (id, annotation, sequence, start, end) in MySQLcursorObj.fetchall():
+                contigRows[id] = (annotation, sequence, start, end)
+            for contig in contigGroup:
+                if contig not in contigRows:
+                    continue
+                annotation, sequence, start, end = contigRows.get(contig)
+                matches = contigInfo.get(contig)
+                NumLargeMatches = matches[0]
+                MatchPostions = matches[1]
+                if NumLargeMatches==expdup and len(MatchPostions)==0:
+                    # Sequence found only itself. Therefore add to database.
+                    batch.append((annotation, sequence, start, end))
+                else:
+                    # Parts of the seqence were duplicated. Needs further checking.
+                    sequence = self.contigSequence(sequence, annotation, start, end)
+                    if sequence.isascii() and sequence.isalpha() and sequence.isupper():
+                        # Find the regions outside the duplicates from their positions
+                        unmaskedseqs = findUniqueIntervals(len(sequence), MatchPostions, minsize)
+                    else:
+                        # Other characters (or lowercase bases) in the contig, mask the duplicates and check the masked sequence for unmasked regions of sufficient length
+                        MaskedSequence = sequence
+                        for j in range(len(MatchPostions)-2, -1, -2):
+                            duplicate = MatchPostions[j:j+2]
+                            MaskedSequence = MaskedSequence[:duplicate[0]]+MaskedSequence[duplicate[0]:duplicate[1]].lower()+MaskedSequence[duplicate[1]:]
+                        unmaskedseqs = findUnmaskedSeq(MaskedSequence, minsize)
                     for entry in unmaskedseqs:
                         startpos = entry[0]
                         endpos = entry[1]
                         if self.verbosity>1:
                             print("Adding to annotation "+str(annotation)+" contig "+str(startpos)+":"+str(endpos))
-                        MySQLcursorObj2.execute("INSERT INTO DeduplicatedContigs (annotation, sequence, start, end) VALUES ("+str(annotation)+", '"+sequence[startpos:endpos]+"',"+str(startpos+start)+", "+str(endpos+start)+")")
-                        self.FURdb.commit()
+                        batch.append((annotation, self.encodeContig(sequence[startpos:endpos]), startpos+start, endpos+start))
+            if len(batch)>=batchsize:
+                self.insertRows(MySQLcursorObj2, "DeduplicatedContigs", columns, batch)
+                self.FURdb.commit()
+                batch = []
+        self.insertRows(MySQLcursorObj2, "DeduplicatedContigs", columns, batch)
+        self.FURdb.commit()
+        self.recordCoverage("DeduplicatedContigs", firstid)
+        self.recordDedupMethod(method)
+    # Returns the id the next annotation added will receive (or follow).
+    def nextAnnotationId(self):
+        """Returns the id following the last annotation"""
+        MySQLcursorObj = self.FURdb.cursor()
+        MySQLcursorObj.execute("SELECT MAX(id) FROM annotations")
+        lastid = MySQLcursorObj.fetchall()[0][0]
+        if lastid is None:
+            return 1
+        return int(lastid)+1
+    # Records the range of annotation ids processed by a stage (see stages), from the first id processed to the last annotation present.
+    # Ranges overlapping (or adjoining) those already recorded for the stage are merged, so processing the same annotations again does not add a range.
+    # NOTE: Not recorded for databases created before schema version 3 (until upgraded).
+    def recordCoverage(self, stage, firstid=0):
+        """Adds the annotations covered by a stage to the coverage table"""
+        if self.dbschema < 3:
+            return
+        firstid = max(firstid, 1)
+        lastid = self.nextAnnotationId()-1
+        if lastid < firstid:
+            return
+        ranges = self.stageCoverage().get(stage, [])+[[firstid, lastid]]
+        merged = []
+        for rangefirst, rangelast in sorted(ranges):
+            if merged and rangefirst <= merged[-1][1]+1:
+                merged[-1][1] = max(merged[-1][1], rangelast)
+            else:
+                merged.append([rangefirst, rangelast])
+        MySQLcursorObj = self.FURdb.cursor()
+        MySQLcursorObj.execute("DELETE FROM coverage WHERE stage="+self.sqlparam, (stage,))
+        MySQLcursorObj.executemany("INSERT INTO coverage (stage, firstid, lastid) VALUES ("+self.sqlparam+", "+self.sqlparam+", "+self.sqlparam+")", [(stage, rangefirst, rangelast) for rangefirst, rangelast in merged])
+        self.FURdb.commit()
+    # Returns the annotation id ranges processed by each stage.
+    # OUTPUT: Dictionary of stage: list of [firstid, lastid]
+    def stageCoverage(self):
+        """Returns the annotations covered by each stage"""
+        coverage = {}
+        if self.dbschema < 3:
+            return coverage
+        MySQLcursorObj = self.FURdb.cursor()
+        MySQLcursorObj.execute("SELECT stage, firstid, lastid FROM coverage ORDER BY firstid")
+        for (stage, firstid, lastid) in MySQLcursorObj:
+            coverage.setdefault(stage, []).append([firstid, lastid])
+        return coverage
+    # Returns the progress recorded for a stage, or clears it when not resuming.
+    # OUTPUT: Dictionary of chromosome (or "" for stages not split by chromosome): last id committed
+    def loadCheckpoints(self, stage, resume=0):
+        """Returns the checkpoints of a stage"""
+        checkpoints = {}
+        if self.dbschema < 4:
+            return checkpoints
+        if not resume:
+            self.clearCheckpoints(stage)
+            return checkpoints
+        MySQLcursorObj = self.FURdb.cursor()
+        MySQLcursorObj.execute("SELECT chrName, lastid FROM checkpoints WHERE stage="+self.sqlparam, (stage,))
+        for (chrName, lastid) in MySQLcursorObj:
+            checkpoints[chrName] = lastid
+        if checkpoints and self.verbosity:
+            print("-- Resuming "+stage+" from "+str(len(checkpoints))+" checkpoints")
+        return checkpoints
+    # Records the progress of a stage (chromosome, or "": last id).
+    # NOTE: Not committed, the checkpoints are written in the same transaction as the rows they describe.
+    def saveCheckpoints(self, MySQLcursorObj, stage, progress):
+        """Updates the checkpoints of a stage"""
+        if self.dbschema < 4:
+            return
+        for chrName, lastid in progress.items():
+            MySQLcursorObj.execute("DELETE FROM checkpoints WHERE stage="+self.sqlparam+" AND chrName="+self.sqlparam, (stage, chrName))
+            MySQLcursorObj.execute("INSERT INTO checkpoints (stage, chrName, lastid) VALUES ("+self.sqlparam+", "+self.sqlparam+", "+self.sqlparam+")", (stage, chrName, lastid))
+    def clearCheckpoints(self, stage):
+        """Removes the checkpoints of a stage"""
+        if self.dbschema < 4:
+            return
+        MySQLcursorObj = self.FURdb.cursor()
+        MySQLcursorObj.execute("DELETE FROM checkpoints WHERE stage="+self.sqlparam, (stage,))
+        self.FURdb.commit()
+    # Records the deduplication method (see dedupmethods) used to populate the deduplicated contigs table, so appended annotations can be deduplicated the same way.
+    # NOTE: 0 when the method is not known (ie. duplicates read from a PSL file). Not recorded for databases created before schema version 6 (until upgraded).
+    def recordDedupMethod(self, method):
+        """Stores the deduplication method in the info table"""
+        if self.dbschema < 6:
+            return
+        MySQLcursorObj = self.FURdb.cursor()
+        MySQLcursorObj.execute("UPDATE info SET dedupmethod="+str(method)+" WHERE tableid=1")
+        self.FURdb.commit()
+    def dedupMethod(self):
+        """Returns the deduplication method recorded in the info table (0 if not known)"""
+        if self.dbschema < 6:
+            return 0
+        MySQLcursorObj = self.FURdb.cursor()
+        MySQLcursorObj.execute("SELECT dedupmethod FROM info")
+        method = MySQLcursorObj.fetchall()[0][0]
+        if method is None:
+            return 0
+        return int(method)
+    # Builds the secondary indexes defined in tableindexes.
+    # INPUT: List of tables to index (all tables if not provided) and if existing indexes should be rebuilt.
+    @libFURshared.measureStage("createIndexes")
+    def createIndexes(self, tables=None, rebuild=0):
+        """Creates any missing secondary indexes, optionally rebuilding those already present."""
+        MySQLcursorObj = self.FURdb.cursor()
+        for name, table, column, foreignkey in tableindexes:
+            if tables and table not in tables:
+                continue
+            # The foreign key index already covers the column
+            if foreignkey and self.SQLhost != "":
+                continue
+            # Check if the index is already present
+            if self.SQLhost != "":
+                MySQLcursorObj.execute("SHOW INDEX FROM "+table+" WHERE Key_name='"+name+"'")
+            else:
+                MySQLcursorObj.execute("SELECT name FROM sqlite_master WHERE type='index' AND name='"+name+"'")
+            present = len(MySQLcursorObj.fetchall())>0
+            if present and rebuild:
+                if self.verbosity:
+                    print("- Rebuilding index "+name+" on "+table+"("+column+")")
+                if self.SQLhost != "":
+                    MySQLcursorObj.execute("ALTER TABLE "+table+" DROP INDEX "+name+", ADD INDEX "+name+" ("+column+")")
+                else:
+                    MySQLcursorObj.execute("DROP INDEX "+name)
+                    MySQLcursorObj.execute("CREATE INDEX "+name+" ON "+table+" ("+column+")")
+            elif not present:
+                if self.verbosity:
+                    print("- Building index "+name+" on "+table+"("+column+")")
+                MySQLcursorObj.execute("CREATE INDEX "+name+" ON "+table+" ("+column+")")
+        self.FURdb.commit()
+    # Updates a database created by an older version to the current schema.
+    # Each step updates the database from the previous schema version.
+    def upgradeSchema(self):
+        """Updates the tables of a database created with an older schema version"""
+        MySQLcursorObj = self.FURdb.cursor()
+        if self.dbschema < 1:
+            # Version 1: Sequence storage format recorded in the info table (existing sequences are text)
+            if self.verbosity:
+                print("- Updating database schema to version 1")
+            MySQLcursorObj.execute("ALTER TABLE info ADD COLUMN sequenceformat INT DEFAULT 0")
+            MySQLcursorObj.execute("UPDATE info SET tableschema=1, sequenceformat=0 WHERE tableid=1")
+            self.FURdb.commit()
+            self.dbschema = 1
+            self.seqformat = 0
+        if self.dbschema < 2:
+            # Version 2: Contig storage format recorded in the info table (existing contigs include their sequences)
+            if self.verbosity:
+                print("- Updating database schema to version 2")
+            MySQLcursorObj.execute("ALTER TABLE info ADD COLUMN contigstorage INT DEFAULT 0")
+            MySQLcursorObj.execute("UPDATE info SET tableschema=2, contigstorage=0 WHERE tableid=1")
+            self.FURdb.commit()
+            self.dbschema = 2
+            self.contigstorage = 0
+        if self.dbschema < 3:
+            # Version 3: Coverage table of the annotation ids processed by each stage (populated tables are assumed to cover the existing annotations)
+            if self.verbosity:
+                print("- Updating database schema to version 3")
+            MySQLcursorObj.execute("CREATE TABLE coverage ("
+                        "stage VARCHAR(45) NOT NULL,"
+                        "firstid INT,"
+                        "lastid INT)")
+            MySQLcursorObj.execute("UPDATE info SET tableschema=3 WHERE tableid=1")
+            self.FURdb.commit()
+            self.dbschema = 3
+            for stage in stages:
+                MySQLcursorObj.execute("SELECT COUNT(*) FROM "+stage)
+                if MySQLcursorObj.fetchall()[0][0] > 0:
+                    self.recordCoverage(stage)
+        if self.dbschema < 4:
+            # Version 4: Checkpoints table recording the progress of the stage being populated
+            if self.verbosity:
+                print("- Updating database schema to version 4")
+            MySQLcursorObj.execute("CREATE TABLE checkpoints ("
+                        "stage VARCHAR(45) NOT NULL,"
+                        "chrName VARCHAR(45),"
+                        "lastid INT)")
+            MySQLcursorObj.execute("UPDATE info SET tableschema=4 WHERE tableid=1")
+            self.FURdb.commit()
+            self.dbschema = 4
+        if self.dbschema < 5:
+            # Version 5: Table statistics (counted from the existing tables)
+            if self.verbosity:
+                print("- Updating database schema to version 5")
+            MySQLcursorObj.execute("CREATE TABLE tablestats ("
+                        "tablename VARCHAR(45) NOT NULL,"
+                        "rowcount BIGINT,"
+                        "basepairs BIGINT,"
+                        "PRIMARY KEY (tablename))")
+            MySQLcursorObj.execute("UPDATE info SET tableschema=5 WHERE tableid=1")
+            self.FURdb.commit()
+            self.dbschema = 5
+            self.refreshStats()
+        if self.dbschema < 6:
+            # Version 6: Deduplication method recorded in the info table (unknown for existing deduplicated contigs)
+            if self.verbosity:
+                print("- Updating database schema to version 6")
+            MySQLcursorObj.execute("ALTER TABLE info ADD COLUMN dedupmethod INT DEFAULT 0")
+            MySQLcursorObj.execute("UPDATE info SET tableschema=6, dedupmethod=0 WHERE tableid=1")
+            self.FURdb.commit()
+            self.dbschema = 6
+        self.storeMetadata()
+    # Converts the sequences stored in the database to a different storage format.
+    # INPUT: Sequence format (see sequenceformats) and the number of rows to process at a time.
+    # NOTE: The rows are converted in a single transaction so an interrupted conversion leaves the database unchanged.
+    def convertSequenceFormat(self, seqformat, batchsize=batchdefault):
+        """Converts the stored sequences between the text and packed formats"""
+        if self.dbschema < 1:
+            self.upgradeSchema()
+        if seqformat == self.seqformat:
+            return
+        MySQLcursorObj = self.FURdb.cursor()
+        # SQL servers require a binary column to store packed sequences
+        if self.SQLhost != "" and seqformat == 1:
+            for table in seqtables:
+                MySQLcursorObj.execute("ALTER TABLE "+table+" MODIFY sequence MEDIUMBLOB")
+        for table in seqtables:
+            if self.verbosity:
+                print("- Converting sequences in "+table)
+            # Process the table in batches of rows ordered by ID
+            lastid = 0
+            rows = [None]
+            while rows:
+                MySQLcursorObj.execute("SELECT id, sequence FROM "+table+" WHERE id>"+str(lastid)+" ORDER BY id LIMIT "+str(batchsize))
+                rows = MySQLcursorObj.fetchall()
+                updates = []
+                for id, sequence in rows:
+                    updates.append((encodeSequence(self.decodeSequence(sequence), seqformat), id))
+                    lastid = id
+                if updates:
+                    MySQLcursorObj.executemany("UPDATE "+table+" SET sequence="+self.sqlparam+" WHERE id="+self.sqlparam, updates)
+        MySQLcursorObj.execute("UPDATE info SET sequenceformat="+str(seqformat)+" WHERE tableid=1")
+        self.FURdb.commit()
+        self.seqformat = seqformat
+        self.storeMetadata()
+        if self.SQLhost != "" and seqformat == 0:
+            for table in seqtables:
+                MySQLcursorObj.execute("ALTER TABLE "+table+" MODIFY sequence TEXT")
+    # Changes if the contig tables store sequences or only the contig positions.
+    # INPUT: Contig storage format (see contigstorageformats) and the number of rows to process at a time.
+    def convertContigStorage(self, contigstorage, batchsize=batchdefault):
+        """Removes or restores the sequences stored in the contig tables"""
+        if self.dbschema < 2:
+            self.upgradeSchema()
+        if contigstorage == self.contigstorage:
+            return
+        MySQLcursorObj = self.FURdb.cursor()
+        for table in contigtables:
+            if self.verbosity:
+                print("- Converting contigs in "+table)
+            if contigstorage == 1:
+                # The sequences are retrieved from the flanking regions when needed
+                MySQLcursorObj.execute("UPDATE "+table+" SET sequence=NULL")
+            else:
+                # Retrieve the sequences from the flanking regions and store them with the contigs
+                lastid = 0
+                rows = [None]
+                while rows:
+                    MySQLcursorObj.execute("SELECT id, annotation, start, end FROM "+table+" WHERE id>"+str(lastid)+" ORDER BY id LIMIT "+str(batchsize))
+                    rows = MySQLcursorObj.fetchall()
+                    updates = []
+                    for id, annotation, start, end in rows:
+                        updates.append((self.encodeSequence(self.materialiseSequence(annotation, start, end)), id))
+                        lastid = id
+                    if updates:
+                        MySQLcursorObj.executemany("UPDATE "+table+" SET sequence="+self.sqlparam+" WHERE id="+self.sqlparam, updates)
+        MySQLcursorObj.execute("UPDATE info SET contigstorage="+str(contigstorage)+" WHERE tableid=1")
+        self.FURdb.commit()
+        self.contigstorage = contigstorage
+        self.storeMetadata()
     # This function allows a table to be reset, to allow the content to be regenerated.
     def deleteTableRows(self, tablename):
         """Function to remove all content from a table"""
         MySQLcursorObj = self.FURdb.cursor()
         MySQLcursorObj.execute("DELETE FROM "+str(tablename))
+        if self.dbschema >= 5 and tablename in statstables:
+            MySQLcursorObj.execute("UPDATE tablestats SET rowcount=0, basepairs=0 WHERE tablename="+self.sqlparam, (tablename,))
+        # The stage populating the table no longer covers any annotations (and cannot be resumed)
+        if tablename in stages:
+            if self.dbschema >= 3:
+                MySQLcursorObj.execute("DELETE FROM coverage WHERE stage="+self.sqlparam, (tablename,))
+            if self.dbschema >= 4:
+                MySQLcursorObj.execute("DELETE FROM checkpoints WHERE stage="+self.sqlparam, (tablename,))
+        if self.dbschema >= 6 and tablename == "DeduplicatedContigs":
+            MySQLcursorObj.execute("UPDATE info SET dedupmethod=0 WHERE tableid=1")
         self.FURdb.commit()
+        self.flankingcache = [None, []]
+        self.storeMetadata()
     # General database information functions:
     # Function to return information on each table
+    # NOTE: Read from the tablestats table (from schema version 5), otherwise counted from the tables (see countTableSizes).
     def tablesizes(self):
         """Returns a list of table names, number of entries and size in bps"""
+        if self.dbschema < 5:
+            return self.countTableSizes()
+        MySQLcursorObj = self.FURdb.cursor()
+        MySQLcursorObj.execute("SELECT tablename, rowcount, basepairs FROM tablestats")
+        tablestats = {}
+        for (tablename, rowcount, basepairs) in MySQLcursorObj:
+            tablestats[tablename] = [tablename, int(rowcount), int(basepairs)]
+        return [tablestats.get(table, [table, 0, 0]) for table in statstables]
+    # Counts the rows in each table and the length of every sequence (reads each sequence table in full).
+    def countTableSizes(self):
+        """Returns a list of table names, number of entries and size in bps, counted from the tables"""
         MySQLcursorObj = self.FURdb.cursor()
         # Add annotation information:
         MySQLcursorObj.execute("SELECT count(*) FROM annotations")
         for (count) in MySQLcursorObj:
             tableinfo=[['annotations',count[0],0]]
         # Add sequence containing tables:
-        seqtables = ["flanking","UnmaskedContigs","DeduplicatedContigs"]
         for table in seqtables:
             MySQLcursorObj.execute("SELECT count(*) FROM "+table)
             for (count) in MySQLcursorObj:
                 count=count[0]
             basepairs = 0
-            MySQLcursorObj.execute("SELECT sequence FROM "+table)
-            for (sequence) in MySQLcursorObj:
-                basepairs = basepairs+len(sequence[0])
+            MySQLcursorObj.execute("SELECT sequence, start, end FROM "+table)
+            for (sequence, start, end) in MySQLcursorObj:
+                if sequence is None:
+                    basepairs = basepairs+int(end)-int(start)
+                else:
+                    basepairs = basepairs+self.sequenceLength(sequence)
             # Add to tableinfo list
             tableinfo=tableinfo+[[table, count, basepairs]]
         return tableinfo
+    # Recounts the table statistics, correcting them if the tables have been changed outside of FURdb.
+    def refreshStats(self):
+        """Replaces the stored table statistics with counts from the tables"""
+        if self.dbschema < 5:
+            self.upgradeSchema()
+            return
+        MySQLcursorObj = self.FURdb.cursor()
+        MySQLcursorObj.execute("DELETE FROM tablestats")
+        for tablename, rowcount, basepairs in self.countTableSizes():
+            MySQLcursorObj.execute("INSERT INTO tablestats VALUES ("+self.sqlparam+", "+self.sqlparam+", "+self.sqlparam+")", (tablename, rowcount, basepairs))
+        self.FURdb.commit()
     def databaseInfo(self):
         """Returns general database information"""
         # Check database schema.
@@ -330,9 +1314,13 @@ class dedupFile(object):
     """Deduplication file object"""
     def __init__(self, fileobj):
         """Setup deduplication object"""
-        self.fileobj = fileobj
+        # A list of files is read in turn, as if they were a single file
+        if isinstance(fileobj, (list, tuple)):
+            self.fileobjs = list(fileobj)
+        else:
+            self.fileobjs = [fileobj]
         self.setColumnsPSL()
-        self.setDataStart()
+        self.dataStartPos = [self.setDataStart(fileobj) for fileobj in self.fileobjs]
     # Set the columns order - in a separate function incase other filetypes are added later
     def setColumnsPSL(self):
         """Setup the column order for a PSL file"""
@@ -342,46 +1330,47 @@ class dedupFile(object):
         self.matchStartCol = 11
         self.matchEndCol = 12
         self.targetName = 13
-    def setDataStart(self):
+    def setDataStart(self, fileobj):
         """Identify the position where the header ends and the data starts"""
-        self.fileobj.seek(0)
-        line = self.fileobj.readline()
+        fileobj.seek(0)
+        line = fileobj.readline()
         matchedbases = line.split('\t')[self.matchSizeCol]
-        while not matchedbases.isdigit():
-            line = self.fileobj.readline()
+        while not matchedbases.isdigit() and line != "":
+            line = fileobj.readline()
             matchedbases = line.split('\t')[self.matchSizeCol]
-        self.dataStartPos = self.fileobj.tell() - len(line)
+        return fileobj.tell() - len(line)
+    def readLines(self):
+        """Returns the data lines from each file in turn, reading them as required"""
+        for fileobj, dataStartPos in zip(self.fileobjs, self.dataStartPos):
+            fileobj.seek(dataStartPos)
+            for line in fileobj:
+                yield line
+    # Reads the matches, storing the number of large duplicates and the positions of smaller duplicates found for each contig.
+    # NOTE: Positions are stored in an array of alternating start and end positions, avoiding a list per match.
     def processFile(self, minsize, ignorealt = 0):
-        # Return: Dictionary[ID]=[NumLargeMatches,[[start,end],[start,end]]]
-        self.fileobj.seek(self.dataStartPos)
+        # Return: Dictionary[ID]=[NumLargeMatches,array([start,end,start,end])]
         contigResults = {}
-        for line in self.fileobj.readlines():
-            fields = line.split('\t')
+        lastcol = max(self.queryNameCol, self.querySizeCol, self.matchSizeCol, self.matchStartCol, self.matchEndCol, self.targetName)
+        for line in self.readLines():
+            # Only split the columns required
+            fields = line.split('\t', lastcol+1)
+            if len(fields) <= lastcol:
+                continue
             if ignorealt and fields[self.targetName].strip()[-4:]=="_alt":
                 # Ignoring entry on alternative chromosome sequence
-                pass
+                continue
+            contig = int(fields[self.queryNameCol])
+            contigValues = contigResults.get(contig)
+            if contigValues is None:
+                # Create new entry
+                contigValues = [0, array.array('i')]
+                contigResults[contig] = contigValues
+            # Check if this a long duplicate, if a smaller duplicate store the positions
+            if int(fields[self.matchSizeCol]) + minsize > int(fields[self.querySizeCol]):
+                contigValues[0] = contigValues[0]+1
             else:
-                # Check if this a long duplicate
-                if int(fields[self.matchSizeCol]) + minsize > int(fields[self.querySizeCol]):
-                    largeduplicate = 1
-                    positions = None
-                else:
-                    largeduplicate = 0
-                    positions = [int(fields[self.matchStartCol]), int(fields[self.matchEndCol])]
-                # If a smaller duplicate store the positions
-                if fields[self.queryNameCol] not in contigResults:
-                    # Create new entry
-                    if positions:
-                        contigResults[fields[self.queryNameCol]] = [largeduplicate,[positions]]
-                    else:
-                        contigResults[fields[self.queryNameCol]] = [largeduplicate,[]]
-                else:
-                    # Update existing
-                    currentvalues = contigResults.get(fields[self.queryNameCol])
-                    if positions:
-                        contigResults[fields[self.queryNameCol]] = [currentvalues[0]+largeduplicate,currentvalues[1]+[positions]]
-                    else:
-                        contigResults[fields[self.queryNameCol]] = [currentvalues[0]+largeduplicate,currentvalues[1]]
+                contigValues[1].append(int(fields[self.matchStartCol]))
+                contigValues[1].append(int(fields[self.matchEndCol]))
         return contigResults
 
 # Current process: Read each match entry.
@@ -390,67 +1379,670 @@ class dedupFile(object):
 # Next function:
 # Current process: If
 
+# Functions to convert sequences to and from the storage formats (see sequenceformats and contigstorageformats).
+# NOTE: Used by the database objects and worker processes, which do not have a database connection.
+def encodeSequence(sequence, seqformat):
+    """Converts a sequence into the format stored in the database"""
+    if seqformat == 1 and sequence is not None:
+        return libFURshared.packSequence(sequence)
+    return sequence
+def decodeSequence(value, seqformat):
+    """Converts a stored sequence back into a sequence string"""
+    if seqformat == 1 and value is not None:
+        return libFURshared.unpackSequence(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode("ascii")
+    return value
+def encodeContig(sequence, seqformat, contigstorage):
+    """Converts a contig sequence into the value stored in the contig tables (nothing if only coordinates are stored)"""
+    if contigstorage == 1:
+        return None
+    return encodeSequence(sequence, seqformat)
+
+# Splits flanking regions into contigs, removing the soft masked (lowercase) regions.
+# INPUT: List of flanking regions (annotation, stored sequence, start, end), minimum contig size, storage formats, verbosity and if the flanking sequences are stored values (otherwise sequence strings)
+# OUTPUT: List of contig rows (annotation, stored sequence, start, end) and the number of bases processed
+def extractContigs(flankingrows, minsize, seqformat=0, contigstorage=0, verbosity=0, encoded=1):
+    """Returns the unmasked contigs found in a list of flanking regions"""
+    contigrows = []
+    basecount = 0
+    for annotation, sequence, start, end in flankingrows:
+        if encoded:
+            sequence = decodeSequence(sequence, seqformat)
+        if not sequence:
+            continue
+        basecount = basecount+len(sequence)
+        for startpos, endpos in findUnmaskedSeq(sequence, minsize):
+            if verbosity>1:
+                print("Adding to annotation "+str(annotation)+" contig "+str(startpos)+":"+str(endpos))
+            contigrows.append((annotation, encodeContig(sequence[startpos:endpos], seqformat, contigstorage), startpos+start, endpos+start))
+    return contigrows, basecount
+def contigWorker(task):
+    """Returns the contig rows for a task (flanking regions, minimum size, storage formats, verbosity) in a worker process"""
+    return extractContigs(*task)
+
+# Called when a worker process starts, so an interrupt (Ctrl-C, sent to every process) is only handled by the main process.
+# NOTE: A worker interrupted while reading a task leaves the pool's task queue part read, and terminating the pool then waits forever.
+def ignoreInterrupts():
+    """Ignores interrupts in a worker process"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+# Runs a list of commands, with a limited number running at once.
+# INPUT: List of commands (each a list of the program and its arguments), maximum number of concurrent processes and verbosity
+# OUTPUT: List of return codes, in command order
+def runCommands(commands, jobs=1, verbosity=0):
+    """Runs external programs in parallel and returns their exit codes"""
+    if verbosity:
+        for command in commands:
+            print(" ".join(command))
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        return list(executor.map(subprocess.call, commands))
+
+# Function to produce a short summary of the number of items processed per second.
+# INPUT: Number of items processed, a description of the items and the time processing started
+# OUTPUT: Summary string
+def reportRate(count, description, starttime):
+    """Returns a string reporting the number of items processed and the rate per second."""
+    elapsed = time.time()-starttime
+    if elapsed>0:
+        rate = int(count/elapsed)
+    else:
+        rate = count
+    return "-- Processed "+str(count)+" "+description+" in "+"{:.1f}".format(elapsed)+"s ("+str(rate)+" "+description+"/s)"
+
 # Function to separate out contigs from a given softmapped sequence.
 # INPUT: Sequence and minimum contig size.
 # OUTPUT: List of unmasked seqence positions - start, end
+# Note: An unmasked region starts at an uppercase base and continues until the next lowercase base (or the end of the sequence).
+unmaskedPattern = re.compile("[A-Z][^a-z]*")
 def findUnmaskedSeq(sequence, minsize):
     """Identifies regions which are unmasked (uppercase) and above the minimum size and returns those positions."""
-    counter = 0
-    startpos=-1
-    endpos=-1
     remainSeqList = []
-    for i in sequence:
-        if i.isupper() and startpos<0:
-            startpos=counter
-        elif i.islower() and startpos>-1:
-            endpos=counter
-            if endpos-startpos>=minsize:
-                # Add contig to database
-                remainSeqList.append([startpos, endpos])
-            # Reset start and end
-            startpos=-1
-            endpos=-1
-        counter=counter+1
+    for match in unmaskedPattern.finditer(sequence):
+        startpos, endpos = match.span()
+        if endpos-startpos>=minsize:
+            remainSeqList.append([startpos, endpos])
+    return remainSeqList
+
+# Function to identify the regions of a contig outside of the duplicated regions (equivalent to masking the duplicates and using findUnmaskedSeq).
+# INPUT: Contig length, duplicate positions (alternating start and end positions) and minimum contig size.
+# OUTPUT: List of unique sequence positions - start, end
+def findUniqueIntervals(length, positions, minsize):
+    """Identifies regions outside the duplicated intervals which are above the minimum size and returns those positions."""
+    minsize = max(minsize, 1)   # Regions must contain at least one base
+    remainSeqList = []
+    startpos = 0
+    # Check the gaps between the duplicates in start position order
+    for duplicateStart, duplicateEnd in sorted(zip(positions[0::2], positions[1::2])):
+        if duplicateStart>=length:
+            break
+        if duplicateEnd<=duplicateStart:
+            continue
+        # Overlapping duplicates are merged by only moving the start position forwards
+        if duplicateStart-startpos>=minsize:
+            remainSeqList.append([startpos, duplicateStart])
+        if duplicateEnd>startpos:
+            startpos = duplicateEnd
+    if length-startpos>=minsize:
+        remainSeqList.append([startpos, length])
     return remainSeqList
 
 ### Functions to load genomic sequences
 
-# This function goes through the provided genome file and creates an index of chromosome start positions to speed up the loadChr function.
-# Input: Human Genome filename
-# Output: Dictionary of chromosome start positions
-def indexFASTA(fileobj):
-	"""Creates a dictionary of chromosome start positions."""
-	line = fileobj.readline()
-	name = ""
-	position = 0
-	indexDict = {}
-	while line:
-		if line[0] == ">":
-			name = line[1:].strip()
-			position = fileobj.tell()-len(line)
-			indexDict[name]=position
-		line=fileobj.readline()
-	return indexDict
-
-# This function loads into memory the specified chromosome
-# Input: Human Genome as a single fasta file and name of chromosome
-# Output: Chromosome sequence as a string
-def loadChr(fileobj, chromosome="", index={}):
-    """Loads into memory the sequence for a single chromosome."""
-    identifier = ""
-    sequence = ""
-    if chromosome in index:
-        fileobj.seek(index.get(chromosome))	# If an index dictionary is passed and contains the chromosome value skip to this point
-        line = fileobj.readline()
-        while line:
-            if line[0] == ">":
-                if identifier==chromosome:
-                    break
-                identifier = line[1:].strip()
-            elif identifier == chromosome:
-                sequence = sequence + line.strip()
-            line=fileobj.readline()
-    return sequence
+# An object which provides random access to the sequences in a genome FASTA file.
+# Uses a samtools compatible index (<genome>.fai), which is created and saved alongside the genome the first time it is used.
+# The genome is memory mapped, so regions are sliced from the OS page cache (shared between processes) rather than held in memory.
+# Requires genome file object (or filename)
+# Returns genome sequence from chromosome start and end positions
+# NOTE: Chromosomes with inconsistent line lengths can not be indexed, sequences are not available for these chromosomes.
+class genomeobj(object):
+    """Indexed genome providing quick sequence retrieval"""
+    def __init__(self, fileobj, verbosity=0, index=None):
+        """Open the genome and load or create the index"""
+        if isinstance(fileobj, str):
+            self.filename = fileobj
+        else:
+            self.filename = fileobj.name
+        self.verbosity = verbosity
+        self.genomefile = open(self.filename, 'rb')     # Binary mode allows seeking to byte positions
+        # Memory map the genome, regions are then read from the OS page cache (shared between processes) without seeking
+        if os.path.getsize(self.filename) > 0:
+            self.genomemap = mmap.mmap(self.genomefile.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.genomemap = None
+        self.indexfilename = self.filename+".fai"
+        if index:
+            # Reuse an index provided by another genome object (ie. in worker processes)
+            self.chrIndex, self.chrOrder, self.chrCheck = index
+        elif os.path.exists(self.indexfilename) and os.path.getmtime(self.indexfilename) >= os.path.getmtime(self.filename):
+            self.loadIndex()
+        else:
+            if verbosity:
+                print("- Indexing genome")
+            self.indexGenome()
+            self.saveIndex()
+    def indexGenome(self):
+        """Creates an index of chromosome lengths, sequence start positions and line lengths"""
+        self.chrIndex = {}      # Chromosome name = [length, offset, line bases, line width]
+        self.chrOrder = []
+        self.chrCheck = {}      # Chromosome name = 1 if consistent line lengths are used, otherwise 0
+        name = None
+        position = 0
+        self.genomefile.seek(0)
+        for line in self.genomefile:
+            if line[:1] == b">":
+                # New chromosome entry (the name is the text up to the first whitespace, as samtools)
+                name = line[1:].split()[0].decode() if line[1:].strip() else ""
+                self.chrIndex[name] = [0, position+len(line), 0, 0]
+                self.chrOrder.append(name)
+                self.chrCheck[name] = 1
+                shortline = 0
+            elif name is not None:
+                entry = self.chrIndex[name]
+                bases = len(line.rstrip(b"\r\n"))
+                if entry[0] == 0 and entry[2] == 0:
+                    # First line sets the expected line length
+                    entry[2] = bases
+                    entry[3] = len(line)
+                elif shortline and bases > 0:
+                    # Only the last line of an entry may be shorter than the others
+                    self.chrCheck[name] = 0
+                elif bases > entry[2] or (line[-1:] == b"\n" and len(line)-bases != entry[3]-entry[2]):
+                    self.chrCheck[name] = 0
+                if bases < entry[2]:
+                    shortline = 1
+                entry[0] = entry[0]+bases
+            position = position+len(line)
+        if self.verbosity:
+            for chr in self.chrOrder:
+                if self.chrCheck.get(chr) == 0:
+                    print(chr+" failed the genome consistancy check.")
+    def loadIndex(self):
+        """Loads a previously saved index"""
+        self.chrIndex = {}
+        self.chrOrder = []
+        self.chrCheck = {}
+        with open(self.indexfilename, 'r') as fileobj:
+            for line in fileobj:
+                fields = line.split('\t')
+                if len(fields) >= 5:
+                    self.chrIndex[fields[0]] = [int(fields[1]), int(fields[2]), int(fields[3]), int(fields[4])]
+                    self.chrOrder.append(fields[0])
+                    self.chrCheck[fields[0]] = 1
+    def saveIndex(self):
+        """Saves the index (samtools .fai format) for reuse, provided every chromosome passed the consistency check"""
+        if 0 in self.chrCheck.values():
+            if self.verbosity:
+                print("WARNING: Genome index not saved as some chromosomes failed the consistency check.")
+            return
+        try:
+            with open(self.indexfilename, 'w') as fileoutobj:
+                for chr in self.chrOrder:
+                    entry = self.chrIndex.get(chr)
+                    fileoutobj.write(chr+"\t"+str(entry[0])+"\t"+str(entry[1])+"\t"+str(entry[2])+"\t"+str(entry[3])+"\n")
+        except OSError:
+            if self.verbosity:
+                print("WARNING: Unable to save the genome index to "+self.indexfilename)
+    def getIndex(self):
+        """Returns the index, allowing it to be shared with other genome objects"""
+        return (self.chrIndex, self.chrOrder, self.chrCheck)
+    def hasChromosome(self, chr):
+        """Returns true if the sequence for a chromosome is available"""
+        return self.chrCheck.get(chr) == 1
+    def chrLength(self, chr):
+        """Returns the length of a chromosome"""
+        if chr in self.chrIndex:
+            return self.chrIndex.get(chr)[0]
+        return 0
+    def getSequence(self, chr, start, end):
+        """Returns the requested region of the genome (positions outside the chromosome are excluded)"""
+        return self.getSequenceBytes(chr, start, end).decode("ascii")
+    def getSequenceBytes(self, chr, start, end):
+        """Returns the requested region of the genome as bytes, sliced directly from the memory mapped genome"""
+        if not self.hasChromosome(chr):
+            if self.verbosity:
+                print("WARNING: Check failed for "+chr+". Unable to retrieve sequence.")
+            return b""
+        length, offset, linebases, linewidth = self.chrIndex.get(chr)
+        start = max(start, 0)
+        end = min(end, length)
+        if end <= start:
+            return b""
+        # Calculate the file positions from the number of complete lines before each position
+        startpos = offset+(start//linebases)*linewidth+start%linebases
+        endpos = offset+(end//linebases)*linewidth+end%linebases
+        return self.genomemap[startpos:endpos].translate(None, b"\r\n")
+    def close(self):
+        """Closes the genome file"""
+        if self.genomemap is not None:
+            self.genomemap.close()
+        self.genomefile.close()
+
+# Extracts the flanking regions on either side of each annotation on a chromosome.
+# INPUT: Genome object, chromosome, list of annotations (id, alignStart, alignEnd), flanking region size and offset, sequence storage format
+# OUTPUT: Flanking region rows (annotation, sequence, start, end), the following region then the preceeding region for each annotation
+# Note: Differences in numbering systems could cause an out by one error in the stored sequence.
+def extractFlanks(genome, chr, annotations, size, offset, seqformat=0):
+    """Yields the flanking regions of a list of annotations"""
+    for id, alignStart, alignEnd in annotations:
+        # Retrieve following genomic region
+        startpos = int(alignEnd)+offset
+        endpos = startpos+size
+        seq = genome.getSequence(chr, startpos, endpos)
+        # Check if the sequence is the expected length and correct if needed
+        if len(seq)!=size:
+            endpos = startpos+len(seq)
+        if seq!="":
+            yield (id, encodeSequence(seq, seqformat), startpos, endpos)
+        # Retrieve preceeding genomic region
+        endpos = int(alignStart)-offset
+        startpos = endpos-size
+        seq = genome.getSequence(chr, startpos, endpos)
+        # Check if the sequence is the expected length and correct if needed
+        if len(seq)!=size:
+            startpos = endpos-len(seq)
+        if seq!="":
+            yield (id, encodeSequence(seq, seqformat), startpos, endpos)
+
+# Task functions used by database.processFlankingRegions, called with the genome, chromosome and list of annotations.
+def extractFlanksTask(genome, chr, annotations, size, offset, seqformat=0):
+    """Returns the flanking region rows for a list of annotations"""
+    return list(extractFlanks(genome, chr, annotations, size, offset, seqformat))
+def extractContigsTask(genome, chr, annotations, size, offset, minsize, seqformat=0, contigstorage=0, flankcoordinates=0, verbosity=0):
+    """Returns the flanking region positions (if requested), unmasked contig rows and number of bases processed for a list of annotations"""
+    flanks = list(extractFlanks(genome, chr, annotations, size, offset))
+    flankingrows = []
+    if flankcoordinates:
+        flankingrows = [(annotation, None, start, end) for annotation, sequence, start, end in flanks]
+    contigrows, basecount = extractContigs(flanks, minsize, seqformat, contigstorage, verbosity, 0)
+    return flankingrows, contigrows, basecount
+
+# Flanking region worker processes, each opens the genome once and then processes tasks (task function and its arguments) passed to flankingWorker.
+# NOTE: Workers ignore interrupts (Ctrl-C), leaving the main process to stop them (see ignoreInterrupts).
+workergenome = None
+def initFlankingWorker(filename, index):
+    """Opens the genome in a worker process"""
+    global workergenome
+    ignoreInterrupts()
+    workergenome = genomeobj(filename, index=index)
+def flankingWorker(task):
+    """Returns the result of a task function in a worker process"""
+    return task[0](workergenome, *task[1:])
+
+### Functions for k-mer based deduplication
+
+# Translation tables, converting bases to uppercase (any other character is treated as an ambiguous base, N) and to their complement
+kmertable = bytes(c if c in b"ACGT" else c-32 if c in b"acgt" else ord("N") for c in range(256))
+complementtable = bytes.maketrans(b"ACGTN", b"TGCAN")
+# Bases converted to digits (0-3), with each run of known bases found as a run of digits
+kmerdigittable = bytes.maketrans(b"ACGT", b"0123")
+digitrunPattern = re.compile(b"[0-3]+")
+
+# Converts each k-mer of a run of bases (as digits 0-3) into a number (2 bits per base).
+# INPUT: Digits and the k-mer size (up to 31)
+# OUTPUT: List of k-mer codes, in position order
+# NOTE: Rather than converting each k-mer a longer run is packed (4 bases per byte) once for each of the 4 positions within a byte,
+#       then read as 64 bit numbers at each byte, so each k-mer is one shift and whole arrays are converted at once.
+def kmerCodes(digits, k):
+    """Returns the codes of the k-mers in a run of bases"""
+    count = len(digits)-k+1
+    # Short runs are converted one k-mer at a time (packing costs more than it saves below a few hundred k-mers)
+    if count < 200:
+        return [int(digits[i:i+k], 4) for i in range(count)]
+    codes = [0]*count
+    shift = 64-2*k
+    for phase in range(4):
+        # Pad the packed bases so each k-mer has a complete 64 bit number starting at its byte
+        bases = digits[phase:]
+        bases = bases+b"0"*((-len(bases))%4+32)
+        packed = int(bases, 4).to_bytes(len(bases)//4, 'big')
+        for offset in range(8):
+            # Numbers starting every 8 bytes from the offset, the k-mers starting every 32 bases from phase+4*offset
+            positions = range(phase+4*offset, count, 32)
+            if not positions:
+                continue
+            numbers = array.array('Q', packed[offset:offset+len(positions)*8])
+            if sys.byteorder == "little":
+                numbers.byteswap()
+            codes[positions.start::32] = [number>>shift for number in numbers]
+    return codes
+
+# Function to list the k-mers of a sequence as numbers (2 bits per base, so the order of the numbers matches the order of the k-mers).
+# INPUT: Sequence (string or bytes) and k-mer size (up to 31).
+# OUTPUT: Start of each run of known bases and the canonical k-mers of the run (the lesser of the k-mer and its reverse complement), in position order
+# NOTE: Only runs of known bases are read, so k-mers containing an ambiguous base (N) are skipped without being checked.
+def canonicalKmerRuns(sequence, k):
+    """Yields the start and canonical k-mer codes of each run of known bases in a sequence"""
+    if isinstance(sequence, str):
+        sequence = sequence.encode("ascii")
+    sequence = sequence.translate(kmertable)
+    digits = sequence.translate(kmerdigittable)
+    reverse = sequence.translate(complementtable)[::-1].translate(kmerdigittable)
+    length = len(digits)
+    for run in digitrunPattern.finditer(digits):
+        runstart, runend = run.span()
+        if runend-runstart < k:
+            continue
+        # The reverse complement k-mers are read from the end of the reversed run
+        yield runstart, [code if code < reversecode else reversecode for code, reversecode in zip(kmerCodes(digits[runstart:runend], k), reversed(kmerCodes(reverse[length-runend:length-runstart], k)))]
+
+# Function to join the regions covered by unique k-mers.
+# INPUT: Sorted list of unique k-mer positions, k-mer size and minimum contig size.
+# OUTPUT: List of unique sequence positions - start, end
+def findKmerIntervals(positions, k, minsize):
+    """Merges overlapping k-mers and returns the regions above the minimum size"""
+    remainSeqList = []
+    startpos = -1
+    endpos = -1
+    for position in positions:
+        if position > endpos:
+            if endpos-startpos>=minsize and startpos>-1:
+                remainSeqList.append([startpos, endpos])
+            startpos = position
+        endpos = position+k
+    if endpos-startpos>=minsize and startpos>-1:
+        remainSeqList.append([startpos, endpos])
+    return remainSeqList
+
+# The canonical k-mers of a set of sequences (ie. the unmasked contigs) and the number of times each was found, held as a sorted array of k-mer codes (see canonicalKmerRuns).
+# The k-mers are split into shards (by range of k-mer codes), which are sorted and counted separately so the work can be shared between processes (see shardKmers and countShardKmers).
+# NOTE: Uses roughly 8 bytes per distinct k-mer for the codes, 1 for the counts, up to 16 for the index of the codes and up to 16 for a filter used to skip most of the k-mers not present.
+class kmercountobj(object):
+    """Counted k-mers, as a sorted array of k-mer codes"""
+    def __init__(self, shardlist, k):
+        """Joins the counted shards (list of sorted k-mer code arrays and their counts, in shard order)"""
+        self.kmers = array.array('q')
+        self.counts = bytearray()
+        for kmers, counts in shardlist:
+            self.kmers.extend(kmers)
+            self.counts.extend(counts)
+        # Position of the first k-mer for each value of the high bits of the k-mer codes (one or two values per k-mer)
+        bits = min(2*k, max(1, len(self.kmers).bit_length()))
+        self.shift = 2*k-bits
+        bucketcounts = [0]*((1<<bits)+1)
+        for code in self.kmers:
+            bucketcounts[(code>>self.shift)+1] += 1
+        self.index = array.array('q', itertools.accumulate(bucketcounts))
+        # Flag each value of the low bits of the k-mers present (with at least 8 values per k-mer)
+        self.filtermask = (1<<max(16, (8*len(self.kmers)).bit_length()))-1
+        self.filter = bytearray(self.filtermask+1)
+        for code in self.kmers:
+            self.filter[code&self.filtermask] = 1
+    def __len__(self):
+        """Returns the number of distinct k-mers"""
+        return len(self.kmers)
+    def findAll(self, codes):
+        """Returns the position of each k-mer of a list (-1 if not present)"""
+        kmers = self.kmers
+        index = self.index
+        shift = self.shift
+        kmerfilter = self.filter
+        filtermask = self.filtermask
+        length = len(kmers)
+        # Search the k-mers sharing the high bits of each k-mer passing the filter (finding where it is, or would be, in the array)
+        positions = [bisect.bisect_left(kmers, code, index[code>>shift], index[(code>>shift)+1]) if kmerfilter[code&filtermask] else length for code in codes]
+        return [position if position < length and kmers[position] == code else -1 for position, code in zip(positions, codes)]
+    def countAll(self, codes):
+        """Returns the number of times each k-mer of a list was found (up to 2, 0 if not present)"""
+        counts = self.counts
+        return [counts[position] if position >= 0 else 0 for position in self.findAll(codes)]
+
+# Sorts the canonical k-mers of a group of sequences into shards (by range of k-mer codes, so the shards can be joined in order).
+# INPUT: List of sequences, k-mer size (up to 31) and the number of shards
+# OUTPUT: List of k-mer arrays for each shard
+def shardKmers(sequences, k, shards):
+    """Returns the k-mers of a group of sequences sorted into shards"""
+    shardlist = [array.array('q') for i in range(shards)]
+    for sequence in sequences:
+        for runstart, kmers in canonicalKmerRuns(sequence, k):
+            if shards == 1:
+                shardlist[0].fromlist(kmers)
+            else:
+                for code in kmers:
+                    shardlist[(code*shards)>>(2*k)].append(code)
+    return shardlist
+def shardKmersWorker(task):
+    """Returns the sharded k-mers for a task (sequences, k-mer size and number of shards) in a worker process"""
+    return shardKmers(*task)
+# Counts the k-mers of a shard.
+# INPUT: Array of k-mers
+# OUTPUT: Sorted array of the distinct k-mers and the number of times each was found (up to 2, as a bytearray)
+def countShardKmers(codes):
+    """Returns the distinct k-mers of a shard and their counts"""
+    kmers = array.array('q')
+    counts = bytearray()
+    lastcode = -1
+    for code in sorted(codes):
+        if code != lastcode:
+            kmers.append(code)
+            counts.append(1)
+            lastcode = code
+        elif counts[-1] == 1:
+            counts[-1] = 2
+    return kmers, counts
+
+# Counts the k-mers of a genome region which are present in a set of k-mers (ie. the contig k-mers).
+# INPUT: Genome object, k-mers to count (see kmercountobj), chromosome, region start and end, k-mer size
+# OUTPUT: Dictionary of the k-mers found (by position in the k-mer array) and their number
+def countKmers(genome, kmers, chr, start, end, k):
+    """Returns the number of times the requested k-mers occur in a genome region"""
+    counts = collections.Counter()
+    # Extend the region so each k-mer starting in the region is complete
+    for runstart, codes in canonicalKmerRuns(genome.getSequenceBytes(chr, start, end+k-1), k):
+        counts.update([position for position in kmers.findAll(codes) if position >= 0])
+    return counts
+
+# K-mer counting worker processes, each opens the genome once and keeps a copy of the k-mers to count.
+# NOTE: Workers ignore interrupts (Ctrl-C), leaving the main process to stop them (see ignoreInterrupts).
+workerkmers = None
+def initKmerWorker(filename, index, kmers):
+    """Opens the genome and stores the k-mers in a worker process"""
+    global workergenome, workerkmers
+    ignoreInterrupts()
+    workergenome = genomeobj(filename, index=index)
+    workerkmers = kmers
+def kmerWorker(task):
+    """Returns the k-mer counts for a task (chromosome, region start and end, k-mer size) in a worker process"""
+    return countKmers(workergenome, workerkmers, *task)
+
+# A genome mappability track, recording (one bit per genome position) if the k-mer starting at each position is found only once in the genome.
+# The track is built the first time it is used, by sorting the genome k-mers into buckets and finding those present once, then saved alongside the genome (<genome>.k<k>.map).
+# The track is memory mapped, so checking a region only reads the bits for that region.
+# NOTE: Building the track requires temporary disk space of roughly 16 bytes per genome base, and memory of roughly 50 bytes per k-mer in a bucket (see mapbucketsize) for each job.
+class mappabilityobj(object):
+    """Genome mappability track providing quick checks for unique regions"""
+    def __init__(self, genomefilename, k=kmerdefault, ignorealt=0, jobs=1, verbosity=0):
+        """Open the track, building it if not present"""
+        if k > 31:
+            raise ValueError("Mappability tracks support k-mers of up to 31 bases")
+        self.genome = genomeobj(genomefilename, verbosity)
+        self.k = k
+        self.ignorealt = ignorealt
+        self.verbosity = verbosity
+        if ignorealt:
+            self.filename = self.genome.filename+".k"+str(k)+".noalt.map"
+        else:
+            self.filename = self.genome.filename+".k"+str(k)+".map"
+        # Each chromosome's track starts at a new byte
+        self.chrOffset = {}
+        offset = 0
+        for chr in self.genome.chrOrder:
+            if self.includeChromosome(chr):
+                self.chrOffset[chr] = offset
+                offset = offset+(self.genome.chrLength(chr)+7)//8
+        self.tracksize = offset
+        if not self.checkTrack():
+            self.buildTrack(jobs)
+        self.trackfile = open(self.filename, 'rb')
+        self.track = mmap.mmap(self.trackfile.fileno(), 0, access=mmap.ACCESS_READ)
+    def includeChromosome(self, chr):
+        """Returns true if a chromosome is included in the track"""
+        return self.genome.hasChromosome(chr) and not (self.ignorealt and chr[-4:]=="_alt")
+    def checkTrack(self):
+        """Returns true if a saved track is present and matches the genome"""
+        if not os.path.exists(self.filename) or os.path.getmtime(self.filename) < os.path.getmtime(self.genome.filename):
+            return False
+        if os.path.getsize(self.filename) != mapheader.size+self.tracksize:
+            return False
+        with open(self.filename, 'rb') as fileobj:
+            identifier, k, ignorealt = mapheader.unpack(fileobj.read(mapheader.size))
+        return identifier == b"FURMAP01" and k == self.k and ignorealt == self.ignorealt
+    @libFURshared.measureStage("buildTrack")
+    def buildTrack(self, jobs=1):
+        """Creates the track, identifying the k-mers found once in the genome"""
+        starttime = time.time()
+        if self.verbosity:
+            print("- Building genome mappability track ("+str(self.k)+"-mers), "+self.filename)
+        tasks = []
+        for chr in self.chrOffset:
+            for regionStart in range(0, self.genome.chrLength(chr), maptasksize):
+                regionEnd = min(regionStart+maptasksize, self.genome.chrLength(chr))
+                tasks.append((chr, regionStart, regionEnd, self.k, self.chrOffset.get(chr)*8))
+        buckets = max(1, (self.tracksize*8)//mapbucketsize)
+        positionbits = (self.tracksize*8).bit_length()
+        pool = None
+        if jobs > 1:
+            pool = multiprocessing.Pool(jobs, initFlankingWorker, (self.genome.filename, self.genome.getIndex()))
+        workdir = tempfile.mkdtemp(prefix="FURmap")
+        try:
+            # Sort the k-mers of each genome region into buckets (by k-mer), stored as temporary files
+            # NOTE: The bucket files are opened for each write, as a large genome has too many buckets to keep open at once.
+            bucketfilenames = [os.path.join(workdir, "bucket"+str(i)) for i in range(buckets)]
+            if pool:
+                results = pool.imap(mapKmersWorker, [task+(buckets,) for task in tasks])
+            else:
+                results = (mapKmers(self.genome, *task, buckets) for task in tasks)
+            for bucketlist in results:
+                for filename, (codes, positions) in zip(bucketfilenames, bucketlist):
+                    with open(filename, 'ab') as fileobj:
+                        fileobj.write(struct.pack("<Q", len(codes)))
+                        codes.tofile(fileobj)
+                        positions.tofile(fileobj)
+            if self.verbosity:
+                print("-- Sorted the k-mers of "+str(len(tasks))+" genome regions into "+str(buckets)+" buckets ("+"{:.1f}".format(time.time()-starttime)+"s)")
+            # Mark the positions of the k-mers found once in each bucket
+            trackbits = bytearray(self.tracksize)
+            if pool:
+                results = pool.imap(uniqueKmerPositionsWorker, [(filename, positionbits) for filename in bucketfilenames])
+            else:
+                results = (uniqueKmerPositions(filename, positionbits) for filename in bucketfilenames)
+            for positions in results:
+                for position in positions:
+                    trackbits[position>>3] |= 1<<(position&7)
+            # Save the track (replacing any previous track once complete)
+            tmpfilename = self.filename+".tmp"
+            with open(tmpfilename, 'wb') as fileobj:
+                fileobj.write(mapheader.pack(b"FURMAP01", self.k, self.ignorealt))
+                fileobj.write(trackbits)
+            os.replace(tmpfilename, self.filename)
+        except BaseException:
+            # Stop the workers immediately if the build fails or is interrupted (joining would wait for abandoned tasks, leaving the bucket files behind)
+            if pool:
+                pool.terminate()
+            raise
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+            shutil.rmtree(workdir, ignore_errors=True)
+        if self.verbosity:
+            print("-- Mappability track built in "+"{:.1f}".format(time.time()-starttime)+"s")
+    def findUniqueRegions(self, chr, start, end, minsize):
+        """Returns the regions (relative to start) covered by k-mers found once in the genome, above the minimum size"""
+        if chr not in self.chrOffset:
+            return []
+        end = min(end, self.genome.chrLength(chr))
+        windows = end-start-self.k+1
+        if start < 0 or windows <= 0:
+            return []
+        # Read the bits for each k-mer starting in the region (bit i of the value is the k-mer starting at start+i)
+        firstbit = self.chrOffset.get(chr)*8+start
+        firstbyte = mapheader.size+firstbit//8
+        lastbyte = mapheader.size+(firstbit+windows-1)//8+1
+        value = (int.from_bytes(self.track[firstbyte:lastbyte], 'little') >> (firstbit%8)) & ((1<<windows)-1)
+        # Join the runs of unique k-mers, each run covers from its first position to the end of its last k-mer
+        remainSeqList = []
+        startpos = -1
+        endpos = -1
+        for run in uniquerunPattern.finditer(format(value, 'b')[::-1]):
+            if run.start() > endpos:
+                if endpos-startpos>=minsize and startpos>-1:
+                    remainSeqList.append([startpos, endpos])
+                startpos = run.start()
+            endpos = run.end()-1+self.k
+        if endpos-startpos>=minsize and startpos>-1:
+            remainSeqList.append([startpos, endpos])
+        return remainSeqList
+    def close(self):
+        """Closes the track and genome files"""
+        self.track.close()
+        self.trackfile.close()
+        self.genome.close()
+
+# Functions used to build the mappability track.
+uniquerunPattern = re.compile("1+")
+# Sorts the canonical k-mers of a genome region into buckets, each k-mer is stored as a number (2 bits per base) with its position in the track.
+# INPUT: Genome object, chromosome, region start and end, k-mer size (up to 31), position of the chromosome in the track and the number of buckets
+# OUTPUT: List of (k-mers, positions) arrays for each bucket
+def mapKmers(genome, chr, start, end, k, trackoffset, buckets):
+    """Returns the k-mers of a genome region sorted into buckets"""
+    bucketlist = [(array.array('q'), array.array('q')) for i in range(buckets)]
+    for runstart, kmers in canonicalKmerRuns(genome.getSequenceBytes(chr, start, end+k-1), k):
+        firstposition = trackoffset+start+runstart
+        if buckets == 1:
+            codes, positions = bucketlist[0]
+            codes.fromlist(kmers)
+            positions.extend(range(firstposition, firstposition+len(kmers)))
+        else:
+            for position, code in enumerate(kmers, firstposition):
+                codes, positions = bucketlist[code%buckets]
+                codes.append(code)
+                positions.append(position)
+    return bucketlist
+def mapKmersWorker(task):
+    """Returns the bucketed k-mers for a task (chromosome, region start and end, k-mer size, track position and number of buckets) in a worker process"""
+    return mapKmers(workergenome, *task)
+# Identifies the k-mers found once in a bucket file.
+# INPUT: Bucket filename and the number of bits needed to store a track position
+# OUTPUT: Array of track positions
+# NOTE: Each k-mer and its position are combined into a single number and sorted, so repeated k-mers are next to each other.
+#       This uses roughly 50 bytes per k-mer (see mapbucketsize), around half the memory of a dictionary of k-mers.
+def uniqueKmerPositions(filename, positionbits):
+    """Returns the positions of the k-mers found once in a bucket"""
+    kmerkeys = []
+    with open(filename, 'rb') as fileobj:
+        header = fileobj.read(8)
+        while header:
+            count = struct.unpack("<Q", header)[0]
+            codes = array.array('q')
+            codes.fromfile(fileobj, count)
+            positions = array.array('q')
+            positions.fromfile(fileobj, count)
+            kmerkeys.extend([(code<<positionbits)|position for code, position in zip(codes, positions)])
+            header = fileobj.read(8)
+    kmerkeys.sort()
+    # Scan the sorted k-mers, keeping the position of each k-mer which differs from those either side of it
+    positionmask = (1<<positionbits)-1
+    uniquePositions = array.array('q')
+    lastcode = -1
+    lastkey = -1
+    repeated = 0
+    for key in kmerkeys:
+        code = key>>positionbits
+        if code != lastcode:
+            if lastkey >= 0 and not repeated:
+                uniquePositions.append(lastkey&positionmask)
+            lastcode = code
+            lastkey = key
+            repeated = 0
+        else:
+            repeated = 1
+    if lastkey >= 0 and not repeated:
+        uniquePositions.append(lastkey&positionmask)
+    return uniquePositions
+def uniqueKmerPositionsWorker(task):
+    """Returns the positions of the k-mers found once in a bucket (filename, position size) in a worker process"""
+    return uniqueKmerPositions(*task)
 
 ######## Work In Progress Code #######
 
@@ -480,91 +2072,3 @@ class sequenceobj(object):
         self.sequence = sequence
         self.start = start
         self.end = end
-
-# An object which stores all the methods and variables to enable quick access to genomic sequence data
-# Requires genome file object
-# Returns genome sequence from chromosome start and end positions
-# This method is unable to process genomes with inconsistant use of white space. Use with caution.
-class genomeobj(object):
-    """Load a genome and provide an index for quick sequence retrival"""
-    def __init__(self, fileobj, verbosity=0):
-        self.genomeobj = fileobj
-        if verbosity:
-            print("Indexing genome")
-        self.indexGenome()
-        if verbosity:
-            print("Checking genome")
-        self.checkGenome()
-        if verbosity:
-            for chr in self.chrCheck:
-                if self.chrCheck.get(chr)==0:
-                    print(chr+" failed the genome consistancy check.")
-    def indexGenome(self):
-        """Creates an index of chromosome start and end positions"""
-        self.genomeobj.seek(0)
-        name = ""
-        position = 0
-        indexStart = {}
-        indexEnd = {}
-        line = self.genomeobj.readline()
-        while line:
-            if line[0] == ">":
-                posEnd = fileobj.tell()-len(line)
-                if name!="":
-                    indexEnd[name]=posEnd
-                name = line[1:].strip()
-                posStart = self.genomeobj.tell()
-                indexStart[name] = posStart
-            line=self.genomeobj.readline()
-        self.chrStartPositions = indexStart
-        self.chrEndPositions = indexEnd
-    def checkGenome(self):
-        """Checks the FASTA file for consistant use of whitespace. Note this method is not fool proof."""
-        # Check for each chromosome
-        lineLengths = {}
-        lineWhiteSpaces = {}
-        lineWhiteSpaceContents = {}
-        chrCheck = {}
-        for chr in self.chrStartPositions:
-            # Get line length with and without whitespace.
-            self.genomeobj.seek(self.chrStartPositions.get(chr))
-            line = self.genomeobj.readline()
-            lineLengths[chr] = len(line)
-            lineWhiteSpaces[chr] = lineLengths.get(chr)-len(line.strip())
-            lineWhiteSpaceContents[chr] = line[lineWhiteSpaces.get(chr):]
-            # Calculate the expected length of the last line
-            expectedLength = self.chrEndPositions.get(chr) % lineLengths.get(chr)
-            # Check if the last line is this length, if not the line lengths must be inconsistant.
-            self.genomeobj.seek(self.chrEndPositions.get(chr)-(lineLengths.get(chr)+lineWhiteSpaces.get(chr)))
-            lastLine = self.genomeobj.read(expectedLength+lineWhiteSpaces.get(chr))
-            if lastLine[:lineWhiteSpaces.get(chr)] == lineWhiteSpaceContents.get(chr):
-                # Passed: Penultimate line break where it was expected.
-                chrCheck[chr] = 1
-            else:
-                # Failed: Penultimate line break not present where expected.
-                chrCheck[chr] = 0
-        # Make the data available outside this function
-        self.chrLineLengths = lineLengths
-        self.chrLineWhiteSpaces = lineWhiteSpaces
-        self.chrLineWhiteSpaceContents = lineWhiteSpaceContents
-        self.chrCheck = chrCheck
-        # Reset file pointer
-        self.genomeobj.seek(0)
-    def getSequence(self, chr, start, end):
-        """Returns the requested region of the genome"""
-        if self.chrCheck.get(chr)==1:
-            # Calculate the file start position
-            numLines = start//self.chrLineLengths.get(chr)
-            startpos = self.chrStartPositions.get(chr)+start+(numLines*self.chrLineWhiteSpaces.get(chr))
-            # Calculate the file end position
-            numLines = end//self.chrLineLengths.get(chr)
-            endpos = self.chrStartPositions.get(chr)+end+(numLines*self.chrLineWhiteSpaces.get(chr))
-            readlength = endpos - startpos
-            # Read the sequence
-            self.genomeobj.seek(startpos)
-            sequence = self.genomeobj.read(readlength)
-        else:
-            sequence = ""
-            if self.verbosity:
-                print("WARNING: Check failed for "+chr+". Unable to retrieve sequence.")
-        return sequence
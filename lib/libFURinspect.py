@@ -6,18 +6,18 @@ from lib import libFURdatabase
 class inspect(libFURdatabase.furdbobj):
     """Inspection class which interacts with the FUR database to lookup and export specific information"""
     # Inherited object creation functions
-    def __init__(self, SQLuser, SQLpass, SQLhost="localhost", SQLdb="FURdb", verbosity=0):
+    def __init__(self, SQLuser, SQLpass, SQLhost="localhost", SQLdb="FURdb", verbosity=0, profile="default"):
         """Create the object, set verbosity and connect it to the SQL database."""
         # Inherit the shared functions from a shared parent class
-        super().__init__(SQLuser, SQLpass, SQLhost, SQLdb, verbosity)
+        super().__init__(SQLuser, SQLpass, SQLhost, SQLdb, verbosity, profile)
     # Returns a single sequence for display or export
     def exportSequenceSingle(self, id=0, table="DeduplicatedContigs"):
         """Retrieve and return a single sequence"""
         Seq=""
         MySQLcursorObj = self.FURdb.cursor()
-        MySQLcursorObj.execute("SELECT sequence FROM "+table+" WHERE id="+str(id))
-        for (sequence) in MySQLcursorObj:
-            Seq = sequence[0]
+        MySQLcursorObj.execute("SELECT sequence, annotation, start, end FROM "+table+" WHERE id="+str(id))
+        for (sequence, annotation, start, end) in MySQLcursorObj.fetchall():
+            Seq = self.contigSequence(sequence, annotation, start, end)
         return Seq
     # Returns which contigs relate to an annotation (and number of alignments if the file is passed)
     def annoContigs(self, id=0, table="DeduplicatedContigs"):
@@ -1,6 +1,18 @@
 # libFURshared
 # Code shared between multiple different parts of the program
 
+import functools
+import json
+import os
+import re
+import struct
+import time
+import tracemalloc
+try:
+    import resource     # Peak memory use (not available on all platforms)
+except ImportError:
+    resource = None
+
 # Function to write out a FASTA entry to a file object
 def exportFASTAEntry(fileobj, ident, sequence):
 	"""Writes a FASTA entry to a provided file object."""
@@ -15,6 +27,82 @@ def exportFASTAEntry(fileobj, ident, sequence):
 		Start = Start+linelength
 		End = End+linelength
 
+### Packed sequence storage
+# Sequences are stored using 2 bits per base (A=0, C=1, G=2, T=3) along with:
+# - Runs of any other character (ie. N) stored as start, length and the character.
+# - Soft masked (lowercase) regions stored as start and end positions.
+# Layout: Header (length, number of other runs, number of masked runs), other runs, masked runs, packed bases.
+packtable = bytearray(256)
+for base, code in [("C",1),("G",2),("T",3)]:
+    packtable[ord(base)] = code
+    packtable[ord(base.lower())] = code
+packtable = bytes(packtable)
+unpacktable = bytes.maketrans(bytes([0,1,2,3]), b"ACGT")
+otherRunPattern = re.compile(rb"([^ACGTacgt])\1*")
+maskRunPattern = re.compile(rb"[a-z]+")
+
+# Function to pack a sequence for storage
+# INPUT: Sequence string
+# OUTPUT: Packed sequence (bytes)
+def packSequence(sequence):
+    """Converts a sequence into the packed 2 bit format."""
+    seqbytes = sequence.encode("ascii")
+    length = len(seqbytes)
+    # Record the runs of non ACGT characters and lowercase regions
+    otherRuns = []
+    otherChars = b""
+    for match in otherRunPattern.finditer(seqbytes):
+        otherRuns.extend([match.start(), match.end()-match.start()])
+        otherChars = otherChars+match.group(1)
+    maskRuns = []
+    for match in maskRunPattern.finditer(seqbytes):
+        maskRuns.extend([match.start(), match.end()])
+    # Pack 4 bases per byte. Each byte of a lane holds a value below 4, so shifting whole lanes can not overflow into a neighbouring byte.
+    codes = seqbytes.translate(packtable)+bytes((4-length%4)%4)
+    numBytes = len(codes)//4
+    packed = (int.from_bytes(codes[0::4],"big")<<6)|(int.from_bytes(codes[1::4],"big")<<4)|(int.from_bytes(codes[2::4],"big")<<2)|int.from_bytes(codes[3::4],"big")
+    header = struct.pack("<III", length, len(otherChars), len(maskRuns)//2)
+    return header+struct.pack("<"+str(len(otherRuns))+"I", *otherRuns)+otherChars+struct.pack("<"+str(len(maskRuns))+"I", *maskRuns)+packed.to_bytes(numBytes,"big")
+
+# Function to unpack a stored sequence
+# INPUT: Packed sequence (bytes)
+# OUTPUT: Sequence string
+def unpackSequence(data):
+    """Converts a packed 2 bit sequence back into a sequence string."""
+    length, numOther, numMask = struct.unpack_from("<III", data, 0)
+    position = 12
+    otherRuns = struct.unpack_from("<"+str(numOther*2)+"I", data, position)
+    position = position+numOther*8
+    otherChars = data[position:position+numOther]
+    position = position+numOther
+    maskRuns = struct.unpack_from("<"+str(numMask*2)+"I", data, position)
+    position = position+numMask*8
+    # Unpack the bases
+    numBytes = len(data)-position
+    packed = int.from_bytes(data[position:], "big")
+    lanemask = int.from_bytes(b"\x03"*numBytes, "big")
+    codes = bytearray(numBytes*4)
+    codes[0::4] = ((packed>>6)&lanemask).to_bytes(numBytes,"big")
+    codes[1::4] = ((packed>>4)&lanemask).to_bytes(numBytes,"big")
+    codes[2::4] = ((packed>>2)&lanemask).to_bytes(numBytes,"big")
+    codes[3::4] = (packed&lanemask).to_bytes(numBytes,"big")
+    sequence = bytearray(bytes(codes[:length]).translate(unpacktable))
+    # Restore other characters and the soft mask
+    for i in range(numOther):
+        start = otherRuns[i*2]
+        size = otherRuns[i*2+1]
+        sequence[start:start+size] = otherChars[i:i+1]*size
+    for i in range(numMask):
+        start = maskRuns[i*2]
+        end = maskRuns[i*2+1]
+        sequence[start:end] = sequence[start:end].lower()
+    return sequence.decode("ascii")
+
+# Returns the length of a packed sequence without unpacking it
+def packedLength(data):
+    """Returns the number of bases in a packed sequence."""
+    return struct.unpack_from("<I", data, 0)[0]
+
 ###
 ### IMPORTANT NOTE: Following functions are also used in Annotation Utilities project
 ###
@@ -32,6 +120,18 @@ def columnnum(header, name, default=-1):
             count = count +1
     return column
 
+# Return a dictionary of column numbers keyed by the names in the header.
+# Note: Resolving the header once per file avoids repeatedly splitting the header for every line.
+def columnmap(header):
+    """Returns a dictionary of column numbers keyed by column name when provided with a tab separated header."""
+    columns = {}
+    count = 0
+    for item in header.split("\t"):
+        if item.strip() not in columns:
+            columns[item.strip()] = count
+        count = count +1
+    return columns
+
 # Function to detect file type
 # Note: The DFAM and UCSC file endings are not standard, but added as an alternative way to manually identify a file.
 def detectFileType(fileobj):
@@ -201,3 +301,177 @@ class Annotation(object):
         else:
             matchStart = self.NullInt
         return matchStart
+
+# Compact record holding only the annotation values stored in the database
+class AnnotationRecord(object):
+    """Minimal annotation entry produced by the annotation parser"""
+    __slots__ = ("repName", "chrName", "alignStart", "alignEnd", "strand", "score", "matchStart", "matchEnd")
+    def __init__(self, repName, chrName, alignStart, alignEnd, strand, score, matchStart, matchEnd):
+        self.repName = repName
+        self.chrName = chrName
+        self.alignStart = alignStart
+        self.alignEnd = alignEnd
+        self.strand = strand
+        self.score = score
+        self.matchStart = matchStart
+        self.matchEnd = matchEnd
+
+# Creates a parsing function for a file type with the column positions resolved once from the header.
+# INPUT: The input file format and the header line where available.
+# OUTPUT: Function which converts a line into an AnnotationRecord (values match those of the Annotation class)
+def annotationParser(type, header="", NullInt=-1):
+    """Returns a function which parses a line from an annotation file into an AnnotationRecord"""
+    columns = columnmap(header)
+    if type=="BED":
+        def parse(line):
+            fields = line.split('\t')
+            return AnnotationRecord(fields[3].strip(), fields[0].strip(), int(fields[1]), int(fields[2]), fields[5].strip(), int(fields[4]), NullInt, NullInt)
+    elif type=="UCSC":
+        strandCol = columns.get("strand", -1)
+        repLeftCol = columns.get("repLeft", -1)
+        repStartCol = columns.get("repStart", -1)
+        repEndCol = columns.get("repEnd", -1)
+        repNameCol = columns.get("repName", -1)
+        chrNameCol = columns.get("genoName", -1)
+        scoreCol = columns.get("swScore", -1)
+        alignStartCol = columns.get("genoStart", -1)
+        alignEndCol = columns.get("genoEnd", -1)
+        def parse(line):
+            fields = line.split('\t')
+            if fields[strandCol] == "-":
+                repstart = int(fields[repLeftCol])
+            else:
+                repstart = int(fields[repStartCol])
+            return AnnotationRecord(fields[repNameCol].strip(), fields[chrNameCol].strip(), int(fields[alignStartCol]), int(fields[alignEndCol]), fields[strandCol].strip(), int(fields[scoreCol]), repstart, int(fields[repEndCol]))
+    elif type=="DFAM":
+        strandCol = columns.get("strand", 8)
+        alignStartCol = columns.get("alignment start", 9)
+        alignEndCol = columns.get("alignment end", 10)
+        repNameCol = columns.get("model name", 2)
+        chrNameCol = columns.get("#sequence name", 0)
+        scoreCol = columns.get("bit score", 3)
+        matchStartCol = columns.get("hmm start", 6)
+        matchEndCol = columns.get("hmm end", 7)
+        def parse(line):
+            fields = line.split('\t')
+            if fields[strandCol] == "-":
+                start = fields[alignEndCol]
+                end = fields[alignStartCol]
+            else:
+                start = fields[alignStartCol]
+                end = fields[alignEndCol]
+            return AnnotationRecord(fields[repNameCol].strip(), fields[chrNameCol].strip(), int(start), int(end), fields[strandCol].strip(), int(float(fields[scoreCol])), int(fields[matchStartCol]), int(fields[matchEndCol]))
+    elif type=="GTF":
+        def parse(line):
+            fields = line.split('\t')
+            if fields[5]==".":                                # Missing values are replaced with a period
+                score = NullInt
+            else:
+                score = int(fields[5])
+            return AnnotationRecord(fields[2].strip(), fields[0].strip(), int(fields[3]), int(fields[4]), fields[6].strip(), score, NullInt, NullInt)
+    else:
+        raise ValueError("Type unsupported "+str(type))
+    return parse
+
+# Generator which parses an annotation file, yielding a record for each entry.
+# INPUT: Annotation file object and the input file format
+# OUTPUT: AnnotationRecord objects
+def parseAnnotations(fileobj, type):
+    """Yields an AnnotationRecord for each entry in an annotation file"""
+    # Store header (if applicable)
+    if type == "BED":
+        header = ""
+    else:
+        header = fileobj.readline()
+    parse = annotationParser(type, header)
+    for line in fileobj:
+        yield parse(line)
+
+### Stage metrics
+# Stages (ie. populating a table) are measured as named spans, recording the wall time, CPU time, rows and bases processed and peak memory use.
+# Each span is written as a line of JSON to the metrics file. If no metrics file is set stages are not measured.
+# NOTE: CPU time and peak memory of worker processes are included once the workers have finished (children_* values).
+metricsfileobj = None   # File object the spans are written to
+metricsspans = []       # Spans being measured (innermost last)
+
+# Set the file the metrics are written to
+# INPUT: File object (opened for writing or appending) and if Python memory allocations should be traced (slower, adds the peak memory allocated within each span)
+def setMetricsFile(fileobj, tracememory=0):
+    """Sets the file spans are written to"""
+    global metricsfileobj
+    metricsfileobj = fileobj
+    if fileobj and tracememory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+# Add to the rows and bases processed by the current span
+def recordProgress(rows=0, bp=0):
+    """Adds the rows and bases processed to the span being measured"""
+    if metricsspans:
+        metricsspans[-1].rows = metricsspans[-1].rows+rows
+        metricsspans[-1].bp = metricsspans[-1].bp+bp
+
+# Decorator measuring each call of a function as a span
+# INPUT: Span name
+def measureStage(name):
+    """Returns a decorator recording calls to a function in the metrics file"""
+    def decorator(function):
+        @functools.wraps(function)
+        def measured(*args, **kwargs):
+            if not metricsfileobj:
+                return function(*args, **kwargs)
+            span = metricsSpan(name)
+            span.start()
+            try:
+                result = function(*args, **kwargs)
+            except BaseException:
+                span.finish("error")
+                raise
+            span.finish()
+            return result
+        return measured
+    return decorator
+
+class metricsSpan(object):
+    """A named stage being measured"""
+    def __init__(self, name):
+        """Create the span"""
+        self.name = name
+        self.rows = 0
+        self.bp = 0
+        self.peakmemory = 0
+    def start(self):
+        """Start measuring"""
+        if metricsspans and tracemalloc.is_tracing():
+            # Keep the enclosing span's peak before measuring this span's own peak
+            metricsspans[-1].peakmemory = max(metricsspans[-1].peakmemory, tracemalloc.get_traced_memory()[1])
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        self.parent = metricsspans[-1].name if metricsspans else None
+        metricsspans.append(self)
+        self.starttime = time.time()
+        self.startwall = time.perf_counter()
+        self.starttimes = os.times()
+    def finish(self, status="ok"):
+        """Stop measuring and write the span to the metrics file"""
+        endtimes = os.times()
+        entry = {"span": self.name,
+                 "parent": self.parent,
+                 "status": status,
+                 "start": round(self.starttime, 3),
+                 "wall_s": round(time.perf_counter()-self.startwall, 3),
+                 "cpu_s": round(max(0, endtimes.user+endtimes.system-self.starttimes.user-self.starttimes.system), 3),
+                 "children_cpu_s": round(max(0, endtimes.children_user+endtimes.children_system-self.starttimes.children_user-self.starttimes.children_system), 3),
+                 "rows": self.rows,
+                 "bp": self.bp}
+        if resource:
+            # Peak resident memory of the process (and its finished worker processes), kilobytes on Linux
+            entry["maxrss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            entry["children_maxrss"] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        if tracemalloc.is_tracing():
+            self.peakmemory = max(self.peakmemory, tracemalloc.get_traced_memory()[1])
+            entry["tracemalloc_peak"] = self.peakmemory
+        metricsspans.remove(self)
+        if metricsspans:
+            metricsspans[-1].peakmemory = max(metricsspans[-1].peakmemory, self.peakmemory)
+        metricsfileobj.write(json.dumps(entry)+"\n")
+        metricsfileobj.flush()
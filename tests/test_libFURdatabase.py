@@ -0,0 +1,123 @@
+# Tests for the FUR database library
+# Run from the repository root: python -m unittest discover tests
+
+import random
+import unittest
+
+from lib import libFURdatabase
+
+# The unmasked region search used before findUnmaskedSeq switched to a regular expression (user-011), kept as the reference behaviour.
+# NOTE: This only ends a region at a lowercase base, so a region running to the end of the sequence is never returned.
+def referenceFindUnmaskedSeq(sequence, minsize):
+    """Identifies regions which are unmasked (uppercase) and above the minimum size and returns those positions."""
+    counter = 0
+    startpos=-1
+    endpos=-1
+    remainSeqList = []
+    for i in sequence:
+        if i.isupper() and startpos<0:
+            startpos=counter
+        elif i.islower() and startpos>-1:
+            endpos=counter
+            if endpos-startpos>=minsize:
+                remainSeqList.append([startpos, endpos])
+            startpos=-1
+            endpos=-1
+        counter=counter+1
+    return remainSeqList
+
+# Random soft-masked sequences with a minimum region size for each (also used by benchmarks/bench_findUnmaskedSeq.py)
+def randomSoftMaskedSequences(count=2000, seed=11):
+    """Yields random soft-masked sequences and minimum sizes"""
+    randomobj = random.Random(seed)
+    for i in range(count):
+        sequence = "".join(randomobj.choice("ACGTNacgtn-") for j in range(randomobj.randint(0, 200)))
+        yield sequence, randomobj.randint(0, 30)
+
+class findUnmaskedSeqTest(unittest.TestCase):
+    """Compare findUnmaskedSeq with the reference behaviour"""
+    def assertMatchesReference(self, sequence, minsize):
+        """Regions must match the reference once the sequence ends with a masked base"""
+        self.assertEqual(libFURdatabase.findUnmaskedSeq(sequence, minsize), referenceFindUnmaskedSeq(sequence+"a", minsize))
+    def test_empty(self):
+        self.assertEqual(libFURdatabase.findUnmaskedSeq("", 0), [])
+    def test_allLowercase(self):
+        self.assertEqual(libFURdatabase.findUnmaskedSeq("acgtnacgt", 1), [])
+        self.assertEqual(libFURdatabase.findUnmaskedSeq("acgtnacgt", 1), referenceFindUnmaskedSeq("acgtnacgt", 1))
+    def test_allUppercase(self):
+        self.assertEqual(libFURdatabase.findUnmaskedSeq("ACGTNACGT", 9), [[0, 9]])
+        self.assertEqual(libFURdatabase.findUnmaskedSeq("ACGTNACGT", 10), [])
+        self.assertMatchesReference("ACGTNACGT", 9)
+    def test_trailingRun(self):
+        # Intended difference: a region reaching the end of the sequence is now returned, the reference loop dropped it.
+        sequence = "acgtACGTacgtACGTAC"
+        self.assertEqual(libFURdatabase.findUnmaskedSeq(sequence, 2), [[4, 8], [12, 18]])
+        self.assertEqual(referenceFindUnmaskedSeq(sequence, 2), [[4, 8]])
+        self.assertMatchesReference(sequence, 2)
+    def test_minsize(self):
+        # Regions of 4 bases, either side of the minimum size (the minimum is inclusive)
+        sequence = "aaACGTaaACGTaaACGT"
+        self.assertEqual(libFURdatabase.findUnmaskedSeq(sequence, 3), [[2, 6], [8, 12], [14, 18]])
+        self.assertEqual(libFURdatabase.findUnmaskedSeq(sequence, 4), [[2, 6], [8, 12], [14, 18]])
+        self.assertEqual(libFURdatabase.findUnmaskedSeq(sequence, 5), [])
+        for minsize in range(0, 7):
+            self.assertMatchesReference(sequence, minsize)
+    def test_otherCharacters(self):
+        # Characters without case continue a region but do not start one
+        self.assertEqual(libFURdatabase.findUnmaskedSeq("-aC-GT-a--A", 1), [[2, 7], [10, 11]])
+        self.assertMatchesReference("-aC-GT-a--A", 1)
+        self.assertMatchesReference("--AC--", 0)
+    def test_randomSequences(self):
+        for sequence, minsize in randomSoftMaskedSequences():
+            self.assertMatchesReference(sequence, minsize)
+
+# The k-mer listing used before the k-mer engine switched to k-mer codes (user-019), kept as the reference behaviour.
+def referenceCanonicalKmers(sequence, k):
+    """Yields the position and canonical form of each k-mer in a sequence"""
+    sequence = sequence.encode("ascii").translate(libFURdatabase.kmertable)
+    reverse = sequence.translate(libFURdatabase.complementtable)[::-1]
+    length = len(sequence)
+    for i in range(length-k+1):
+        kmer = sequence[i:i+k]
+        if b"N" in kmer:
+            continue
+        reversekmer = reverse[length-i-k:length-i]
+        if reversekmer < kmer:
+            yield i, reversekmer
+        else:
+            yield i, kmer
+
+# Converts a k-mer code back to its bases
+def decodeKmer(code, k):
+    """Returns the bases of a k-mer code"""
+    return bytes(b"ACGT"[(code>>(2*(k-1-i)))&3] for i in range(k))
+
+class kmerCodesTest(unittest.TestCase):
+    """Compare the k-mer codes and counts with the reference k-mers"""
+    def randomSequences(self, count):
+        """Returns random sequences including lowercase and ambiguous bases, long enough to use both ways of converting k-mers"""
+        randomobj = random.Random(19)
+        return ["".join(randomobj.choice("ACGTACGTacgtN") for j in range(randomobj.randint(0, 600))) for i in range(count)]
+    def test_canonicalKmerRuns(self):
+        for k in [1, 5, 31]:
+            for sequence in self.randomSequences(200):
+                kmers = [(position, decodeKmer(code, k)) for runstart, codes in libFURdatabase.canonicalKmerRuns(sequence, k) for position, code in enumerate(codes, runstart)]
+                self.assertEqual(kmers, list(referenceCanonicalKmers(sequence, k)))
+    def test_kmerCounts(self):
+        k = 5
+        sequences = self.randomSequences(100)
+        expected = {}
+        for sequence in sequences:
+            for position, kmer in referenceCanonicalKmers(sequence, k):
+                expected[kmer] = min(expected.get(kmer, 0)+1, 2)
+        # The counts must not depend on the number of shards
+        for shards in [1, 3]:
+            shardlist = libFURdatabase.shardKmers(sequences, k, shards)
+            kmerCounts = libFURdatabase.kmercountobj([libFURdatabase.countShardKmers(codes) for codes in shardlist], k)
+            self.assertEqual(len(kmerCounts), len(expected))
+            self.assertEqual(list(kmerCounts.kmers), sorted(kmerCounts.kmers))
+            codes = list(range(4**k))
+            self.assertEqual({decodeKmer(code, k): count for code, count in zip(codes, kmerCounts.countAll(codes)) if count}, expected)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+# Tests for the shared FUR functions
+# Run from the repository root: python -m unittest discover tests
+
+import io
+import random
+import unittest
+
+from lib import libFURshared
+
+# Annotation values stored in the database (see database.populateAnnotations)
+recordfields = ["repName", "chrName", "alignStart", "alignEnd", "strand", "score", "matchStart", "matchEnd"]
+
+# Small annotation files for each supported format
+ucscheader = ["#bin", "swScore", "milliDiv", "milliDel", "milliIns", "genoName", "genoStart", "genoEnd", "genoLeft", "strand", "repName", "repClass", "repFamily", "repStart", "repEnd", "repLeft", "id"]
+ucscrows = [["585", "463", "13", "6", "17", "chr1", "10000", "10468", "-248945954", "+", "L1HS", "LINE", "L1", "1", "471", "-5685", "1"],
+            ["585", "3612", "114", "270", "13", "chr1", "10468", "11447", "-248944975", "-", "L1PA2", "LINE", "L1", "-5", "6150", "5177", "2"],
+            ["586", "484", "251", "0", "0", "chr2", "20000", "20150", "-180000", "+", "L1P4", "LINE", "L1", "5960", "6110", "-45", "3"]]
+dfamheader = ["#sequence name", "model accession", "model name", "bit score", "e-value", "bias", "hmm start", "hmm end", "hmm length", "strand", "alignment start", "alignment end", "envelope start", "envelope end", "sequence length"]
+dfamrows = [["chr1", "DF0000225", "L1HS", "1234.5", "1e-300", "2.1", "5", "6010", "6064", "+", "10001", "16010", "10000", "16012", "248956422"],
+            ["chr3", "DF0000226", "L1PA2", "87.2", "1e-20", "0.4", "4200", "4500", "6163", "-", "50310", "50000", "50312", "49998", "198295559"]]
+gtflines = ["##gff-version 2",
+            "chr1\tRepeatMasker\tL1HS\t10001\t10468\t463\t+\t.\tgene_id \"L1HS_1\"; transcript_id \"L1HS_1\";",
+            "chr2\tRepeatMasker\tL1PA2\t20001\t20150\t.\t-\t.\tgene_id=\"L1PA2_2\";"]
+bedlines = ["chr1\t10000\t10468\tL1HS\t463\t+",
+            "chr2\t20000\t20150\tL1PA2\t0\t-"]
+
+# Joins header and row lists into the lines of a tab separated file
+def tabLines(header, rows):
+    """Returns the lines of a tab separated file"""
+    return ["\t".join(header)]+["\t".join(row) for row in rows]
+
+# Reorders the columns of a tab separated file
+def reorderColumns(header, rows, order):
+    """Returns the header and rows with the columns in the given order"""
+    return [header[i] for i in order], [[row[i] for i in order] for row in rows]
+
+class parseAnnotationsTest(unittest.TestCase):
+    """Compare the annotation records with the values parsed by the Annotation class"""
+    def assertMatchesAnnotation(self, lines, type):
+        """Records parsed from the lines must match the Annotation class, using the first line as the header (except BED)"""
+        text = "\n".join(lines)+"\n"
+        records = list(libFURshared.parseAnnotations(io.StringIO(text), type))
+        fileobj = io.StringIO(text)
+        header = ""
+        if type != "BED":
+            header = fileobj.readline()
+        expected = [libFURshared.Annotation(line, type, header) for line in fileobj]
+        self.assertEqual(len(records), len(expected))
+        for record, annotation in zip(records, expected):
+            self.assertIsNone(annotation.error)
+            self.assertEqual([getattr(record, field) for field in recordfields], [getattr(annotation, field) for field in recordfields])
+        return records
+    def test_ucsc(self):
+        records = self.assertMatchesAnnotation(tabLines(ucscheader, ucscrows), "UCSC")
+        # Minus strand matches start at repLeft
+        self.assertEqual([records[1].matchStart, records[1].matchEnd], [5177, 6150])
+    def test_ucscHeaderWithoutHash(self):
+        self.assertMatchesAnnotation(tabLines(["bin"]+ucscheader[1:], ucscrows), "UCSC")
+    def test_ucscReorderedColumns(self):
+        order = list(range(len(ucscheader)))
+        random.Random(2).shuffle(order)
+        header, rows = reorderColumns(ucscheader, ucscrows, order)
+        records = self.assertMatchesAnnotation(tabLines(header, rows), "UCSC")
+        self.assertEqual([records[0].chrName, records[0].alignStart, records[0].repName], ["chr1", 10000, "L1HS"])
+    def test_dfam(self):
+        records = self.assertMatchesAnnotation(tabLines(dfamheader, dfamrows), "DFAM")
+        # Minus strand alignments are stored start to end, and scores are truncated to integers
+        self.assertEqual([records[1].alignStart, records[1].alignEnd, records[1].score], [50000, 50310, 87])
+    def test_dfamReorderedColumns(self):
+        order = list(range(len(dfamheader)))
+        random.Random(3).shuffle(order)
+        header, rows = reorderColumns(dfamheader, dfamrows, order)
+        self.assertMatchesAnnotation(tabLines(header, rows), "DFAM")
+    def test_dfamMissingColumnNames(self):
+        # Columns missing from the header use the default DFAM positions (only those matching this layout are left unnamed)
+        header = ["", "model accession", "", "", "e-value", "bias", "", "", "hmm length", "strand", "alignment start", "alignment end", "envelope start", "envelope end", "sequence length"]
+        self.assertMatchesAnnotation(tabLines(header, dfamrows), "DFAM")
+    def test_gtf(self):
+        records = self.assertMatchesAnnotation(gtflines, "GTF")
+        # Missing scores use the null value
+        self.assertEqual([records[1].score, records[1].matchStart, records[1].matchEnd], [-1, -1, -1])
+    def test_bed(self):
+        records = self.assertMatchesAnnotation(bedlines, "BED")
+        self.assertEqual(len(records), 2)
+    def test_unsupportedType(self):
+        with self.assertRaises(ValueError):
+            libFURshared.annotationParser("PSL")
+
+if __name__ == "__main__":
+    unittest.main()